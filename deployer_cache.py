@@ -0,0 +1,103 @@
+#!/usr/bin/python
+
+##############################################################################################
+# Copyright (C) 2014 Pier Luigi Ventre - (Consortium GARR and University of Rome "Tor Vergata")
+# Copyright (C) 2014 Giuseppe Siracusano, Stefano Salsano - (CNIT and University of Rome "Tor Vergata")
+# www.garr.it - www.uniroma2.it/netgroup - www.cnit.it
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Deployer Cache.
+#
+# @author Pier Luigi Ventre <pl.ventre@gmail.com>
+# @author Giuseppe Siracusano <a_siracusano@tin.it>
+# @author Stefano Salsano <stefano.salsano@uniroma2.it>
+#
+#
+
+import os
+import hashlib
+import cPickle
+
+# Cache of the deployment plans (topology, addresses, tags and node configurations) derived from
+# a topology file. An entry is identified by the hash of the file content and
+# of the deployer parameters, so it is never used if one of them changes
+CACHE_DIR = os.path.expanduser("~/.dreamer/cache")
+# Max size of the cache (bytes), the least recently used entries are evicted
+CACHE_MAX_SIZE = 256 * 1024 * 1024
+# Version of the plan format, change it when the plan content changes
+CACHE_VERSION = 9
+
+def cache_key(path_json, params):
+	digest = hashlib.sha1()
+	digest.update("version %s\n" % CACHE_VERSION)
+	json_file = open(path_json, 'rb')
+	while True:
+		data = json_file.read(1024 * 1024)
+		if len(data) == 0:
+			break
+		digest.update(data)
+	json_file.close()
+	digest.update(repr(params))
+	return digest.hexdigest()
+
+def cache_path(key):
+	return os.path.join(CACHE_DIR, key + ".plan")
+
+# Provides the plan stored with key, None if it is not cached (or it is corrupted)
+def load_plan(key):
+	path = cache_path(key)
+	if os.path.exists(path) == False:
+		return None
+	try:
+		plan_file = open(path, 'rb')
+		plan = cPickle.load(plan_file)
+		plan_file.close()
+	except Exception, e:
+		print "*** WARNING Discarding Corrupted Cache Entry", path, "-", e
+		os.remove(path)
+		return None
+	# Refresh the access time for the LRU eviction
+	os.utime(path, None)
+	return plan
+
+def store_plan(key, plan):
+	if os.path.exists(CACHE_DIR) == False:
+		os.makedirs(CACHE_DIR)
+	path = cache_path(key)
+	tmp_path = "%s.%s.tmp" % (path, os.getpid())
+	plan_file = open(tmp_path, 'wb')
+	cPickle.dump(plan, plan_file, cPickle.HIGHEST_PROTOCOL)
+	plan_file.close()
+	os.rename(tmp_path, path)
+	evict_plans()
+
+# Removes the least recently used entries until the cache fits in max_size
+def evict_plans(max_size=CACHE_MAX_SIZE):
+	entries = []
+	size = 0
+	for name in os.listdir(CACHE_DIR):
+		if name.endswith(".plan") == False:
+			continue
+		path = os.path.join(CACHE_DIR, name)
+		info = os.stat(path)
+		entries.append((info.st_mtime, info.st_size, path))
+		size = size + info.st_size
+	entries.sort()
+	for (mtime, entry_size, path) in entries:
+		if size <= max_size:
+			break
+		print "*** Evicting Cache Entry", path
+		os.remove(path)
+		size = size - entry_size
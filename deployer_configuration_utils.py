@@ -26,19 +26,255 @@
 #
 #
 
+import sys
+
+from collections import OrderedDict
 from mininet.node import Node
+from deployer_utils import make_dir, remove_tree
+from deployer_journal import record
+from deployer_profiler import phase
+from deployer_plan import config_section
+
+# Max length of a batched command line, the commands are split in more
+# invocations (transactions) beyond it. It leaves room for the wrapping of the
+# pipelined commands (see PIPELINE_MAX_LENGTH)
+MAX_BATCH_LENGTH = 3000
+
+# Shell of the root namespace, created once and shared by the deployer
+root_node = None
+
+def get_root():
+	global root_node
+	if root_node == None:
+		root_node = Node( 'root', inNamespace=False )
+	return root_node
+
+# Chains the groups of ovs-vsctl commands with "--" in command lines of at most
+# max_length characters (prefix included), every line is a single OVSDB
+# transaction; the commands of a group are always in the same transaction
+def ovs_vsctl_lines(prefix, groups, max_length=MAX_BATCH_LENGTH):
+	lines = []
+	batch = []
+	length = len(prefix)
+	for group in groups:
+		group_length = sum([len(command) + 4 for command in group])
+		if len(batch) > 0 and length + group_length > max_length:
+			lines.append(prefix + " -- ".join(batch))
+			batch = []
+			length = len(prefix)
+		batch.extend(group)
+		length = length + group_length
+	if len(batch) > 0:
+		lines.append(prefix + " -- ".join(batch))
+	return lines
+
+# Runs the ovs-vsctl commands in the root namespace, chained with "--" so that
+# every invocation is a single OVSDB transaction
+def ovs_vsctl_batch(commands):
+	root = get_root()
+	for line in ovs_vsctl_lines("ovs-vsctl ", [[command] for command in commands]):
+		out = root.cmd(line)
+		if out.strip() != "":
+			print "*** WARNING ovs-vsctl -", out.strip()
+
+# Runs the commands in the namespace of the node, in order, and provides their
+# outputs. The nodes with a pipelined shell (OSHI) run them in a few batches,
+# each one costs a single round-trip
+def run_commands(node, commands):
+	if getattr(node, 'cmdPipeline', None) == None:
+		return [node.cmd(command) for command in commands]
+	outputs = []
+	for (command, (output, code)) in zip(commands, node.cmdPipeline(commands)):
+		if code != 0:
+			print "*** WARNING Command Failed On", node.name, "(Exit Code %s) -" % code, command, "-", output.strip()
+		outputs.append(output)
+	return outputs
+
+# Provides the sections of the configuration as [(name, files, commands)], the
+# files and the commands added before the first section are in "config"
+def config_sections(config):
+	sections = []
+	(name, first_file, first_command) = ("config", 0, 0)
+	for (next_name, last_file, last_command) in config['sections'] + [(None, len(config['files']), len(config['commands']))]:
+		if last_file > first_file or last_command > first_command:
+			sections.append((name, config['files'][first_file:last_file], config['commands'][first_command:last_command]))
+		(name, first_file, first_command) = (next_name, last_file, last_command)
+	return sections
 
-def convert_port_name_to_number(oshi, port):
-	p = oshi.cmd("ovs-ofctl dump-ports-desc br-%s | grep %s |awk -F '(' '{print $1}'| cut -d ' ' -f 2" %(oshi.name, port ))
-	return str(int(p))
+# Applies the configuration of the node compiled in the plan (see new_config),
+# except the start commands. The workdir and the daemons are recorded in the
+# journal before they are created, every section is a phase of the profiling
+def apply_config(node, config):
+	for (daemon, pidfile) in config['pidfiles']:
+		record('daemon', node=node.name, name=daemon, pidfile=pidfile)
+	if config['workdir'] != None:
+		record('dir', node=node.name, path=config['workdir'])
+		remove_tree(config['workdir'])
+		make_dir(config['workdir'])
+	for path in config['dirs']:
+		make_dir(path)
+	for (name, files, commands) in config_sections(config):
+		with phase(name):
+			write_files(files)
+			run_commands(node, commands)
 
-def configure_standalone_sw(switches):
+def write_files(files):
+	for (path, content) in files:
+		conf_file = open(path, "w")
+		conf_file.write(content)
+		conf_file.close()
+
+# Changes in place a running node to the configuration compiled in the plan,
+# commands are provided by compile_update
+def apply_update(node, config, commands):
+	write_files(config['files'])
+	run_commands(node, commands)
+
+# Provides the ovs-vsctl commands (see ovs_vsctl_batch) of the L2 switches
+def compile_standalone_sw(switches):
 	print "*** Configuring L2 Switches"
-	root = Node( 'root', inNamespace=False )
 	for sw in switches:
 		print "*** Configuring", sw.name, "As Learning Switch"
-		root.cmd("ovs-vsctl set-fail-mode %s standalone" % sw.name)
+	return ["set-fail-mode %s standalone" % sw.name for sw in switches]
+
+# Adds to the node configuration the kernel parameters [(name, value)] of its
+# namespace, written by a single sysctl call. The names are separated by "/", so
+# that they can contain interface names with dots (e.g. net/ipv4/conf/vi1.1/rp_filter).
+# It runs after the other commands of the node, so the interfaces of the names
+# exist; an unknown name makes sysctl fail, see run_commands
+def compile_sysctl(config, params, path_conf):
+	config_section(config, "sysctl")
+	config['files'].append((path_conf, "".join(["%s = %s\n" % (name, value) for (name, value) in params])))
+	config['commands'].append("sysctl -q -p %s" % path_conf)
+
+# Modes of compile_flows: 'add' adds the rules (add-flows), 'replace' makes the
+# flow tables equal to the rule set modifying only the differences (replace-flows),
+# 'bundle' replaces the rules inside an OpenFlow 1.4 bundle, so the change is atomic
+FLOWS_MODES = ['add', 'replace', 'bundle']
+
+# Removes from flows the rules with all the fields of match, like ovs-ofctl del-flows
+def del_flows(flows, match):
+	fields = match.split(",")
+	for flow in list(flows):
+		flow_fields = flow[:flow.find("action")].split(",")
+		if all(field in flow_fields for field in fields):
+			flows.remove(flow)
+
+# Adds to the node configuration the whole rule set of the bridge, installed with
+# a single ovs-ofctl call; the rules are written one per line in path_flows
+def compile_flows(config, bridge, flows, path_flows, mode='add'):
+	config_section(config, "flows")
+	config['files'].append((path_flows, "".join([flow + "\n" for flow in flows])))
+	if mode == 'add':
+		config['commands'].append("ovs-ofctl add-flows %s %s" % (bridge, path_flows))
+	elif mode in FLOWS_MODES:
+		config['commands'].append(replace_flows(bridge, path_flows, mode))
+	else:
+		print "Error Unknown Flows Mode", mode
+		sys.exit(-2)
+
+# Provides the command that makes the flow tables of the bridge equal to the
+# rules of path_flows ('replace' and 'bundle' modes of compile_flows). The
+# update of a running bridge (see compile_update) always uses it, also in the
+# 'add' mode, so the rules of the removed ports are deleted
+def replace_flows(bridge, path_flows, mode):
+	if mode == 'bundle':
+		return "ovs-ofctl -O OpenFlow14 --bundle replace-flows %s %s" % (bridge, path_flows)
+	return "ovs-ofctl replace-flows %s %s" % (bridge, path_flows)
 
+# Stanzas of Quagga configuration files, header -> lines; the global lines have
+# the None header and the stanzas with the same header (e.g. an interface in
+# zebra.conf and in ospfd.conf) are merged
+def quagga_stanzas(confs):
+	stanzas = OrderedDict()
+	for conf in confs:
+		lines = stanzas.setdefault(None, [])
+		for line in conf.split("\n"):
+			line = line.strip()
+			if line == "" or line.startswith("!"):
+				continue
+			if line.startswith("interface ") or line.startswith("router "):
+				lines = stanzas.setdefault(line, [])
+			else:
+				lines.append(line)
+	return stanzas
 
+# Setting of a configuration line, without its value (e.g. "ospf cost")
+def quagga_setting(line):
+	tokens = line.split()
+	if len(tokens) > 1 and tokens[-1].isdigit():
+		tokens = tokens[:-1]
+	return " ".join(tokens)
 
+# Provides the vtysh commands that change the running Quagga daemons from the
+# old configuration files to the new ones: in the node of every changed stanza
+# (e.g. "router ospf") the new lines are added and the removed ones negated
+# (unless their setting gets a new value), the adjacencies of the other
+# interfaces stay up. The command lines are at most max_length characters (a
+# stanza is never split). None if the global lines changed, the daemons have to
+# be restarted
+def compile_vtysh_update(old_confs, new_confs, max_length=MAX_BATCH_LENGTH):
+	old = quagga_stanzas(old_confs)
+	new = quagga_stanzas(new_confs)
+	if old.get(None) != new.get(None):
+		return None
+	prefix = "vtysh -c 'configure terminal'"
+	lines = []
+	line = prefix
+	for header in list(old) + [header for header in new if header not in old]:
+		if header == None:
+			continue
+		old_lines = old.get(header, [])
+		new_lines = new.get(header, [])
+		added = [entry for entry in new_lines if entry not in old_lines]
+		settings = [quagga_setting(entry) for entry in added]
+		changes = ["no " + quagga_setting(entry) for entry in old_lines if entry not in new_lines and quagga_setting(entry) not in settings] + added
+		if len(changes) == 0:
+			continue
+		stanza = "".join([" -c '%s'" % entry for entry in [header] + changes + ["exit"]])
+		if line != prefix and len(line) + len(stanza) > max_length:
+			lines.append(line)
+			line = prefix
+		line = line + stanza
+	if line != prefix:
+		lines.append(line)
+	return lines
 
+# Provides the commands that change in place a running node from the old
+# configuration to the new one, (stop, commands): stop runs before the links of
+# the node are removed, it deletes the removed interfaces (and their OVS ports);
+# commands runs after the new links are added, it adds the new interfaces and
+# ports, replaces the rules of the bridge, loads the kernel parameters and
+# changes the running Quagga daemons (see compile_vtysh_update). None if the
+# node has to be stopped and configured again (see new_update)
+def compile_update(old, new):
+	update = new['update']
+	if update == None or old.get('update') != update or old['pidfiles'] != new['pidfiles']:
+		return None
+	old_files = dict(old['files'])
+	new_files = dict(new['files'])
+	vtysh = []
+	if update['quagga'] != None:
+		vtysh = compile_vtysh_update([content for (path, content) in old['files'] if path.startswith(update['quagga'] + "/")],
+			[content for (path, content) in new['files'] if path.startswith(update['quagga'] + "/")])
+		if vtysh == None:
+			return None
+	removed = [intf for intf in sorted(old['intfs']) if old['intfs'][intf] != new['intfs'].get(intf)]
+	added = [intf for intf in sorted(new['intfs']) if new['intfs'][intf] != old['intfs'].get(intf)]
+	stop = []
+	for intf in removed:
+		stop.extend(old['intfs'][intf]['stop'])
+	ports = [["--if-exists del-port " + port for port in old['intfs'][intf]['ports']] for intf in removed]
+	if update['ovsdb'] != None:
+		stop.extend(ovs_vsctl_lines(update['ovsdb'], [group for group in ports if len(group) > 0]))
+	commands = []
+	if update['ovsdb'] != None:
+		commands.extend(ovs_vsctl_lines(update['ovsdb'], [new['intfs'][intf]['ovs'] for intf in added if len(new['intfs'][intf]['ovs']) > 0]))
+	for intf in added:
+		commands.extend(new['intfs'][intf]['commands'])
+	if update['flows'] != None and old_files.get(update['flows'][1]) != new_files[update['flows'][1]]:
+		commands.append(replace_flows(update['flows'][0], update['flows'][1], update['flows'][2]))
+	if update['sysctl'] != None and old_files.get(update['sysctl']) != new_files[update['sysctl']]:
+		commands.append("sysctl -q -p %s" % update['sysctl'])
+	commands.extend(vtysh)
+	return (stop, commands)
@@ -0,0 +1,500 @@
+#!/usr/bin/python
+
+##############################################################################################
+# Copyright (C) 2014 Pier Luigi Ventre - (Consortium GARR and University of Rome "Tor Vergata")
+# Copyright (C) 2014 Giuseppe Siracusano, Stefano Salsano - (CNIT and University of Rome "Tor Vergata")
+# www.garr.it - www.uniroma2.it/netgroup - www.cnit.it
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Deployer Dry Run.
+#
+# @author Pier Luigi Ventre <pl.ventre@gmail.com>
+# @author Giuseppe Siracusano <a_siracusano@tin.it>
+# @author Stefano Salsano <stefano.salsano@uniroma2.it>
+#
+#
+
+# Runs the Mininet Deployer without Mininet and without touching the kernel:
+# the mininet modules are replaced by a backend that records the nodes, the
+# links and every command (Node.cmd and the root side utilities) instead of
+# running them; the files and the dirs written by the deployer go to a sandbox
+# directory. It does not need root, so the plan generation of big topologies
+# can be benchmarked and profiled on any Linux box. Usage (the other options
+# are the ones of mininet_deployer.py):
+#
+#   ./deployer_dryrun.py --record events.json --report dryrun.json --topology file:topo.json
+
+import io
+import os
+import re
+import sys
+import cmd
+import json
+import time
+import types
+import shutil
+import argparse
+import tempfile
+
+from deployer_profiler import command_type
+
+# The commands a dry run answers, with the output of a real deployment
+READY_OUTPUT = "ready\n"
+SERVICE_OUTPUT = "start/running\n"
+# A command of a pipelined command line (see OSHI.cmdPipeline) and the printf
+# of its marker, answered with a zero exit code and the current time
+PIPELINED_COMMAND = re.compile(r"\{ (.*?);? \}; printf '([^']*)' (\d+) \$\? \$\(date \+%s%N\)")
+
+# Records the events of the deployment: the counters are kept in memory, the
+# events are written (one json object per line) only if a record file is given
+class Recorder:
+
+	def __init__(self, path=None):
+		self.start = time.time()
+		self.events = 0
+		self.created = 0
+		self.commands = {}
+		self.nodes = {}
+		self.links = 0
+		self.files = {}
+		self.record_file = None
+		if path != None:
+			self.record_file = open(path, 'w')
+
+	def record(self, kind, node, detail):
+		self.events = self.events + 1
+		if kind == 'cmd':
+			# The commands of a pipelined command line are counted one by one
+			for command in [pipelined for (pipelined, marker, index) in PIPELINED_COMMAND.findall(detail)] or [detail]:
+				kind_cmd = command_type(command)
+				self.commands[kind_cmd] = self.commands.get(kind_cmd, 0) + 1
+				self.nodes[node] = self.nodes.get(node, 0) + 1
+		elif kind == 'node':
+			self.created = self.created + 1
+		elif kind == 'link':
+			self.links = self.links + 1
+		elif kind == 'file':
+			self.files[detail[0]] = detail[1]
+		if self.record_file != None:
+			self.record_file.write(json.dumps({'t':time.time() - self.start, 'kind':kind, 'node':node, 'detail':detail}) + "\n")
+
+	def close(self):
+		if self.record_file != None:
+			self.record_file.close()
+			self.record_file = None
+
+	def report(self):
+		return {
+			'duration_s':time.time() - self.start,
+			'events':self.events,
+			'commands':sum(self.commands.values()),
+			'commands_by_type':self.commands,
+			'commands_by_node':self.nodes,
+			'nodes':self.created,
+			'links':self.links,
+			'files':len(self.files)
+		}
+
+recorder = Recorder()
+# Directory where the files written by the deployer are redirected
+sandbox = None
+
+# Mininet backend
+
+class DryRunIntf:
+
+	def __init__(self, name, node, port):
+		self.name = name
+		self.node = node
+		self.port = port
+		self.link = None
+
+	def __str__(self):
+		return self.name
+
+	def __repr__(self):
+		return self.name
+
+class DryRunLink:
+
+	def __init__(self, node1, node2, port1=None, port2=None, **params):
+		self.intf1 = node1.addIntf(port1)
+		self.intf2 = node2.addIntf(port2)
+		self.intf1.link = self
+		self.intf2.link = self
+		recorder.record('link', node1.name, [self.intf1.name, self.intf2.name])
+
+	def delete(self):
+		self.intf1.node.delIntf(self.intf1)
+		self.intf2.node.delIntf(self.intf2)
+		recorder.record('unlink', self.intf1.node.name, [self.intf1.name, self.intf2.name])
+
+# Stands in for a Mininet node, the commands are recorded and answered with the
+# output a deployment expects; the bridge ports are tracked from the ovs-vsctl
+# commands, so the port table can be dumped
+class DryRunNode(object):
+
+	portBase = 0
+
+	def __init__(self, name, inNamespace=True, **params):
+		self.name = name
+		self.inNamespace = inNamespace
+		self.params = params
+		self.intfs = {}
+		self.ports = {}
+		self.nameToIntf = {}
+		self.waiting = False
+		self.ofport_table = {}
+		recorder.record('node', name, self.__class__.__name__)
+
+	def __str__(self):
+		return self.name
+
+	def __repr__(self):
+		return self.name
+
+	def newPort(self):
+		if len(self.ports) == 0:
+			return self.portBase
+		return max(self.intfs.keys()) + 1
+
+	def addIntf(self, port=None):
+		if port == None:
+			port = self.newPort()
+		intf = DryRunIntf("%s-eth%s" % (self.name, port), self, port)
+		self.intfs[port] = intf
+		self.ports[intf] = port
+		self.nameToIntf[intf.name] = intf
+		return intf
+
+	def delIntf(self, intf):
+		del self.intfs[intf.port]
+		del self.ports[intf]
+		del self.nameToIntf[intf.name]
+
+	def cmd(self, *args, **kwargs):
+		command = " ".join([str(arg) for arg in args])
+		recorder.record('cmd', self.name, command)
+		return self.answer(command)
+
+	def sendCmd(self, *args, **kwargs):
+		recorder.record('cmd', self.name, " ".join([str(arg) for arg in args]))
+		self.waiting = True
+
+	def waitOutput(self, *args, **kwargs):
+		self.waiting = False
+		return ""
+
+	def answer(self, command):
+		tokens = command.split()
+		if len(tokens) == 0:
+			return ""
+		if tokens[0] == '{':
+			output = []
+			for (pipelined, marker, index) in PIPELINED_COMMAND.findall(command):
+				output.append(self.answer(pipelined))
+				output.append(marker.decode('string_escape') % (int(index), 0, "%d" % (time.time() * 1e9)))
+			return "".join(output)
+		if command.rstrip().endswith("echo ready"):
+			return READY_OUTPUT
+		if tokens[0] == 'pwd':
+			return os.getcwd() + "\n"
+		if tokens[0] == 'service' and tokens[-1] == 'status':
+			return SERVICE_OUTPUT
+		if tokens[0] == 'ovs-vsctl':
+			self.track_ports(command)
+		elif tokens[0] == 'ovs-ofctl' and 'dump-ports-desc' in tokens:
+			lines = ["OFPST_PORT_DESC reply (xid=0x2):"]
+			for (port, number) in sorted(self.ofport_table.items(), key=lambda item: item[1]):
+				lines.append(" %s(%s): addr:00:00:00:00:00:00" % (number, port))
+			return "\n".join(lines) + "\n"
+		return ""
+
+	def track_ports(self, command):
+		for segment in command.split(" -- "):
+			tokens = segment.split()
+			while len(tokens) > 0 and (tokens[0] == 'ovs-vsctl' or tokens[0].startswith('--')):
+				tokens = tokens[1:]
+			if len(tokens) >= 3 and tokens[0] == 'add-port':
+				self.ofport_table[tokens[2]] = len(self.ofport_table) + 1
+			elif len(tokens) >= 3 and tokens[0] == 'set' and tokens[1] == 'Interface':
+				for token in tokens[3:]:
+					if token.startswith('ofport_request='):
+						self.ofport_table[tokens[2]] = int(token.split('=')[1])
+
+	def cleanup(self):
+		pass
+
+	def stop(self, deleteIntfs=False):
+		recorder.record('stop', self.name, self.__class__.__name__)
+
+class DryRunSwitch(DryRunNode):
+
+	portBase = 1
+
+	def __init__(self, name, **params):
+		DryRunNode.__init__(self, name, inNamespace=False, **params)
+
+	def start(self, controllers):
+		self.cmd("ovs-vsctl add-br", self.name)
+
+	def attach(self, intf):
+		self.cmd("ovs-vsctl add-port", self.name, intf)
+
+	def detach(self, intf):
+		self.cmd("ovs-vsctl del-port", self.name, intf)
+
+class DryRunController(DryRunNode):
+
+	def __init__(self, name, ip='127.0.0.1', port=6633, **params):
+		DryRunNode.__init__(self, name, inNamespace=False, **params)
+		self.ip = ip
+		self.port = port
+
+class DryRunNet:
+
+	def __init__(self, topo=None, switch=DryRunSwitch, host=DryRunNode, controller=DryRunController, link=DryRunLink, build=True, **params):
+		self.host = host
+		self.switch = switch
+		self.controller = controller
+		self.hosts = []
+		self.switches = []
+		self.controllers = []
+		self.links = []
+		self.nameToNode = {}
+
+	def addHost(self, name, cls=None, **params):
+		if cls == None:
+			cls = self.host
+		node = cls(name, **params)
+		self.hosts.append(node)
+		self.nameToNode[name] = node
+		return node
+
+	def addSwitch(self, name, cls=None, **params):
+		if cls == None:
+			cls = self.switch
+		node = cls(name, **params)
+		self.switches.append(node)
+		self.nameToNode[name] = node
+		return node
+
+	def addController(self, name='c0', controller=None, **params):
+		if controller == None:
+			controller = self.controller
+		node = controller(name, **params)
+		self.controllers.append(node)
+		self.nameToNode[name] = node
+		return node
+
+	def addLink(self, node1, node2, port1=None, port2=None, cls=None, **params):
+		link = DryRunLink(node1, node2, port1, port2, **params)
+		self.links.append(link)
+		return link
+
+	def delLink(self, link):
+		link.delete()
+		self.links.remove(link)
+
+	def delNode(self, node):
+		for nodes in (self.hosts, self.switches, self.controllers):
+			if node in nodes:
+				nodes.remove(node)
+		del self.nameToNode[node.name]
+		node.stop(deleteIntfs=True)
+
+	def getNodeByName(self, *args):
+		if len(args) == 1:
+			return self.nameToNode[args[0]]
+		return [self.nameToNode[name] for name in args]
+
+	# Like Mininet.build(), the default controller is added if there is none
+	def start(self):
+		if len(self.controllers) == 0 and self.controller != None:
+			self.addController('c0')
+		recorder.record('net', None, 'start')
+
+	def stop(self):
+		recorder.record('net', None, 'stop')
+
+# Commands run by the CLI, instead of reading them from the terminal
+cli_commands = []
+
+class DryRunCLI(cmd.Cmd):
+
+	def __init__(self, mininet, *args, **kwargs):
+		cmd.Cmd.__init__(self)
+		self.mn = mininet
+		recorder.record('net', None, 'cli')
+		for line in cli_commands:
+			recorder.record('cli', None, line)
+			self.onecmd(line)
+
+# Root side utilities of mininet.util, "cat" reads the file (e.g. /proc/mounts)
+def dryrun_errRun(*cmd, **kwargs):
+	command = " ".join([str(arg) for arg in cmd])
+	recorder.record('cmd', 'host', command)
+	tokens = command.split()
+	if len(tokens) == 2 and tokens[0] == 'cat' and os.path.exists(tokens[1]):
+		return (open(tokens[1]).read(), "", 0)
+	return ("", "", 0)
+
+def dryrun_quietRun(*cmd, **kwargs):
+	return dryrun_errRun(*cmd, **kwargs)[0]
+
+def dryrun_errFail(*cmd, **kwargs):
+	return dryrun_errRun(*cmd, **kwargs)
+
+class DryRunLog:
+
+	def setLogLevel(self, *args):
+		pass
+
+def dryrun_log(*args, **kwargs):
+	pass
+
+# Installs the backend as the mininet package, it must be called before
+# importing the deployer modules
+def install():
+	modules = {}
+	for name in ['mininet', 'mininet.net', 'mininet.node', 'mininet.link', 'mininet.cli', 'mininet.topo', 'mininet.log', 'mininet.util']:
+		modules[name] = types.ModuleType(name)
+		sys.modules[name] = modules[name]
+	modules['mininet.net'].Mininet = DryRunNet
+	modules['mininet.node'].Node = DryRunNode
+	modules['mininet.node'].Host = DryRunNode
+	modules['mininet.node'].Switch = DryRunSwitch
+	modules['mininet.node'].OVSKernelSwitch = DryRunSwitch
+	modules['mininet.node'].Controller = DryRunController
+	modules['mininet.node'].RemoteController = DryRunController
+	modules['mininet.link'].Link = DryRunLink
+	modules['mininet.cli'].CLI = DryRunCLI
+	modules['mininet.topo'].Topo = object
+	modules['mininet.topo'].SingleSwitchTopo = object
+	modules['mininet.log'].lg = DryRunLog()
+	modules['mininet.log'].setLogLevel = dryrun_log
+	modules['mininet.log'].info = dryrun_log
+	modules['mininet.log'].debug = dryrun_log
+	modules['mininet.util'].errRun = dryrun_errRun
+	modules['mininet.util'].errFail = dryrun_errFail
+	modules['mininet.util'].quietRun = dryrun_quietRun
+
+# Path of the sandbox copy of a file
+def sandbox_path(path):
+	return os.path.join(sandbox, os.path.abspath(path).lstrip('/'))
+
+# Replacement of open for the deployer modules: the writes go to the sandbox,
+# the reads see the sandbox copy if any, a missing file reads as empty
+def dryrun_open(path, mode='r', *args):
+	target = sandbox_path(path)
+	if 'w' in mode or 'a' in mode or '+' in mode:
+		recorder.record('file', None, [os.path.abspath(path), mode])
+		if os.path.exists(os.path.dirname(target)) == False:
+			os.makedirs(os.path.dirname(target))
+		if 'a' in mode and os.path.exists(target) == False and os.path.exists(path):
+			shutil.copyfile(path, target)
+		return open(target, mode, *args)
+	if os.path.exists(target):
+		return open(target, mode, *args)
+	if os.path.exists(path) == False:
+		return io.BytesIO("")
+	return open(path, mode, *args)
+
+# Replacements of the file system changes of the deployer (see make_dir,
+# remove_tree and remove_file in deployer_utils), made in the sandbox
+def dryrun_make_dir(path):
+	recorder.record('dir', None, [os.path.abspath(path), 'mkdir'])
+	target = sandbox_path(path)
+	if os.path.exists(os.path.dirname(target)) == False:
+		os.makedirs(os.path.dirname(target))
+	os.mkdir(target)
+
+def dryrun_remove_tree(path):
+	recorder.record('dir', None, [os.path.abspath(path), 'rmtree'])
+	shutil.rmtree(sandbox_path(path), ignore_errors=True)
+
+def dryrun_remove_file(path):
+	recorder.record('dir', None, [os.path.abspath(path), 'remove'])
+	if os.path.exists(sandbox_path(path)):
+		os.remove(sandbox_path(path))
+
+# The teardown of the journal does not signal the processes of the host, the
+# pidfiles are read from the sandbox
+def dryrun_signal_process(pid, sig, group=False):
+	recorder.record('signal', None, [pid, sig])
+
+def dryrun_read_pidfile(path):
+	try:
+		return int(open(sandbox_path(path)).read().strip())
+	except (IOError, ValueError):
+		return None
+
+def parse_cmd_line():
+	parser = argparse.ArgumentParser(description='Mininet Deployer Dry Run', add_help=False)
+	parser.add_argument('--record', dest='record', action='store', default=None, help='Write the recorded events, one json object per line')
+	parser.add_argument('--report', dest='report', action='store', default=None, help='Write the json summary of the dry run (default stdout)')
+	parser.add_argument('--sandbox', dest='sandbox', action='store', default=None, help='Directory of the written files (default a temporary one, removed at the end)')
+	parser.add_argument('--cli', dest='cli', action='append', default=[], help='Command run by the CLI (repeatable), e.g. "redeploy file:topo.json"')
+	return parser.parse_known_args()
+
+if __name__ == '__main__':
+	(args, deployer_args) = parse_cmd_line()
+	install()
+	import mininet_deployer
+	import deployer_utils
+	import deployer_configuration_utils
+	import deployer_journal
+	recorder = Recorder(args.record)
+	cli_commands = args.cli
+	if args.sandbox != None:
+		sandbox = os.path.abspath(args.sandbox)
+	else:
+		sandbox = tempfile.mkdtemp(prefix="dryrun")
+	for module in [mininet_deployer, deployer_utils, deployer_configuration_utils]:
+		module.open = dryrun_open
+	for module in [mininet_deployer, deployer_configuration_utils, deployer_journal]:
+		module.make_dir = dryrun_make_dir
+		module.remove_tree = dryrun_remove_tree
+		module.remove_file = dryrun_remove_file
+	deployer_journal.signal_process = dryrun_signal_process
+	deployer_journal.read_pidfile = dryrun_read_pidfile
+	if mininet_deployer.vll_path == "":
+		mininet_deployer.vll_path = "./"
+	if mininet_deployer.path_quagga_exec == "":
+		mininet_deployer.path_quagga_exec = "/usr/lib/quagga/"
+	# The journal of the deployment goes to the sandbox
+	if '--journal' not in deployer_args:
+		deployer_args = deployer_args + ['--journal', os.path.join(sandbox, "deployer.journal")]
+	# There are no daemons to wait for
+	if '--convergence-timeout' not in deployer_args:
+		deployer_args = deployer_args + ['--convergence-timeout', '0']
+	sys.argv = [mininet_deployer.__file__] + deployer_args
+	try:
+		mininet_deployer.main()
+	finally:
+		recorder.close()
+		if args.sandbox == None:
+			shutil.rmtree(sandbox, ignore_errors=True)
+	report = recorder.report()
+	if args.report != None:
+		output = open(args.report, 'w')
+	else:
+		output = sys.stdout
+	json.dump(report, output, sort_keys=True, indent=2)
+	output.write('\n')
+	if args.report != None:
+		output.close()
+	sys.stderr.write("*** Dry Run: %s nodes, %s links, %s commands, %s files in %.2fs\n" % (report['nodes'],
+		report['links'], report['commands'], report['files'], report['duration_s']))
@@ -0,0 +1,147 @@
+#!/usr/bin/python
+
+##############################################################################################
+# Copyright (C) 2014 Pier Luigi Ventre - (Consortium GARR and University of Rome "Tor Vergata")
+# Copyright (C) 2014 Giuseppe Siracusano, Stefano Salsano - (CNIT and University of Rome "Tor Vergata")
+# www.garr.it - www.uniroma2.it/netgroup - www.cnit.it
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# IP Address Management.
+#
+# @author Pier Luigi Ventre <pl.ventre@gmail.com>
+# @author Giuseppe Siracusano <a_siracusano@tin.it>
+# @author Stefano Salsano <stefano.salsano@uniroma2.it>
+#
+#
+
+import sys
+
+def ip_to_int(ip):
+	value = 0
+	for octet in ip.split('.'):
+		value = (value << 8) + int(octet)
+	return value
+
+def int_to_ip(value):
+	return "%s.%s.%s.%s" % ((value >> 24) & 255, (value >> 16) & 255, (value >> 8) & 255, value & 255)
+
+def int_to_octets(value):
+	return [(value >> 24) & 255, (value >> 16) & 255, (value >> 8) & 255, value & 255]
+
+# Provides the n-th usable address of the subnet (octets list) with prefix netbit, the
+# /31 (RFC 3021) and /32 use all the addresses, the other ones skip network and broadcast
+def host_address(subnet, netbit, n):
+	if netbit >= 31:
+		offset = n - 1
+		size = 1 << (32 - netbit)
+	else:
+		offset = n
+		size = (1 << (32 - netbit)) - 1
+	if n < 1 or offset >= size:
+		print "Error, Reached The Last Address Of %s/%s" % (".".join([str(octet) for octet in subnet]), netbit)
+		sys.exit(-2)
+	return int_to_ip(ip_to_int(".".join([str(octet) for octet in subnet])) + offset)
+
+# Pool of blocks with prefix prefixlen, carved out of network/netbit. The state is a
+# bitmap of the allocated blocks, a stack of the released ones and the index of the
+# first block never allocated, so allocate and release are O(1). The first reserved
+# blocks are never allocated
+class IPPool:
+
+	def __init__(self, name, network, netbit, prefixlen, reserved=0):
+		if prefixlen < netbit or prefixlen > 32:
+			print "Error Bad Prefix Length For Pool", name
+			sys.exit(-2)
+		self.name = name
+		self.network = network
+		self.netbit = netbit
+		self.prefixlen = prefixlen
+		self.reserved = reserved
+		self.base = ip_to_int(network) & ~((1 << (32 - netbit)) - 1) & 0xffffffff
+		self.size = 1 << (prefixlen - netbit)
+		self.bitmap = bytearray((self.size + 7) // 8)
+		self.released = []
+		self.next = reserved
+
+	def config(self):
+		return (self.name, self.network, self.netbit, self.prefixlen, self.reserved)
+
+	# Provides the block with the given index, as int
+	def block(self, index):
+		return self.base + (index << (32 - self.prefixlen))
+
+	def allocate(self):
+		if len(self.released) > 0:
+			index = self.released.pop()
+		elif self.next < self.size:
+			index = self.next
+			self.next = self.next + 1
+		else:
+			print "%s Address Pool Sold Out (%s/%s)" % (self.name, self.network, self.netbit)
+			sys.exit(-2)
+		self.bitmap[index >> 3] = self.bitmap[index >> 3] | (1 << (index & 7))
+		return self.block(index)
+
+	# Bulk allocation, provides n blocks in one call
+	def allocate_many(self, n):
+		if n > self.available():
+			print "%s Address Pool Sold Out (%s/%s)" % (self.name, self.network, self.netbit)
+			sys.exit(-2)
+		return [self.allocate() for i in range(0, n)]
+
+	# Allocates the given block, if it is free; the blocks skipped to reach it
+	# are left to the next allocations. Provides False if it is not available
+	def claim(self, block):
+		index = (block - self.base) >> (32 - self.prefixlen)
+		if index < self.reserved or index >= self.size or (self.bitmap[index >> 3] & (1 << (index & 7))) != 0:
+			return False
+		if index >= self.next:
+			self.released.extend(reversed(range(self.next, index)))
+			self.next = index + 1
+		else:
+			self.released.remove(index)
+		self.bitmap[index >> 3] = self.bitmap[index >> 3] | (1 << (index & 7))
+		return True
+
+	def release(self, block):
+		index = (block - self.base) >> (32 - self.prefixlen)
+		if index < self.reserved or index >= self.size or (self.bitmap[index >> 3] & (1 << (index & 7))) == 0:
+			print "*** WARNING Releasing", int_to_ip(block), "Not Allocated In Pool", self.name
+			return
+		self.bitmap[index >> 3] = self.bitmap[index >> 3] & ~(1 << (index & 7))
+		self.released.append(index)
+
+	def available(self):
+		return self.size - self.next + len(self.released)
+
+# Set of named pools of the deployment
+class IPAM:
+
+	def __init__(self):
+		self.pools = {}
+
+	def add_pool(self, name, network, netbit, prefixlen, reserved=0):
+		self.pools[name] = IPPool(name, network, netbit, prefixlen, reserved)
+		return self.pools[name]
+
+	def pool(self, name):
+		return self.pools[name]
+
+	def config(self):
+		return sorted([pool.config() for pool in self.pools.values()])
+
+	# Replaces the state of the pools with the one of a stored IPAM
+	def restore(self, other):
+		self.pools = other.pools
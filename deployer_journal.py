@@ -0,0 +1,255 @@
+#!/usr/bin/python
+
+##############################################################################################
+# Copyright (C) 2014 Pier Luigi Ventre - (Consortium GARR and University of Rome "Tor Vergata")
+# Copyright (C) 2014 Giuseppe Siracusano, Stefano Salsano - (CNIT and University of Rome "Tor Vergata")
+# www.garr.it - www.uniroma2.it/netgroup - www.cnit.it
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Deployer Journal.
+#
+# @author Pier Luigi Ventre <pl.ventre@gmail.com>
+# @author Giuseppe Siracusano <a_siracusano@tin.it>
+# @author Stefano Salsano <stefano.salsano@uniroma2.it>
+#
+#
+
+# Records the resources created by the deployment: the shells of the nodes
+# (with them their network namespaces), the daemons, the bind mounts, the
+# temporary dirs and files, the bridges and the interfaces of the root
+# namespace. A record is a json object per line, appended and flushed when the
+# resource is created, so the journal of a crashed run can still be read. The
+# teardown releases exactly the recorded resources, the processes are checked
+# against their command line before being killed (the pids can be reused)
+
+import os
+import json
+import time
+import signal
+import threading
+from mininet.util import errRun
+from deployer_utils import mountPoints, unmountAll, run_tasks, remove_tree, remove_file
+
+JOURNAL_PATH = "/var/run/dreamer/deployer.journal"
+# Max time (seconds) waited for the killed processes, then they get a SIGKILL
+KILL_TIMEOUT = 5
+
+# The active journal, None if the resources are not recorded
+journal = None
+
+class Journal:
+
+	def __init__(self, path):
+		self.path = path
+		self.lock = threading.Lock()
+		if os.path.exists(os.path.dirname(path)) == False:
+			os.makedirs(os.path.dirname(path))
+		self.journal_file = open(path, 'w')
+
+	def record(self, kind, fields):
+		fields['kind'] = kind
+		line = json.dumps(fields, sort_keys=True) + "\n"
+		self.lock.acquire()
+		self.journal_file.write(line)
+		self.journal_file.flush()
+		self.lock.release()
+
+	def close(self):
+		self.journal_file.close()
+
+# Starts a new journal in path, the previous one is overwritten
+def open_journal(path=JOURNAL_PATH):
+	global journal
+	journal = Journal(path)
+	return journal
+
+def close_journal():
+	global journal
+	if journal == None:
+		return
+	journal.close()
+	journal = None
+
+# Records a resource, the kinds are:
+#   node - shell of the node name, pid
+#   mounts - bind mounts of a node under path
+#   dir - temporary dir path
+#   file - temporary file path
+#   daemon - daemon name of a node, its pidfile and (once known) its pid
+#   bridge - bridge name of the root Open vSwitch
+#   intf - interface name of the root namespace
+# It does nothing if there is no journal
+def record(kind, **fields):
+	if journal == None:
+		return
+	journal.record(kind, fields)
+
+# Records the pids of the daemons of the node configurations, read from their
+# pidfiles (see new_config)
+def record_pids(configs):
+	for (name, config) in configs:
+		for (daemon, pidfile) in config['pidfiles']:
+			pid = read_pidfile(pidfile)
+			if pid != None:
+				record('daemon', node=name, name=daemon, pidfile=pidfile, pid=pid)
+
+# Provides the records of a journal, the last line of a crashed run can be truncated
+def load_journal(path):
+	records = []
+	for line in open(path):
+		try:
+			records.append(json.loads(line))
+		except ValueError:
+			print "*** WARNING Skipping Truncated Journal Record In", path
+	return records
+
+def read_pidfile(path):
+	try:
+		pidfile = open(path)
+		pid = int(pidfile.read().strip())
+		pidfile.close()
+		return pid
+	except (IOError, ValueError):
+		return None
+
+# Command line (list of arguments) of a process, None if it does not exist
+def process_cmdline(pid):
+	try:
+		cmdline_file = open("/proc/%d/cmdline" % pid)
+		cmdline = cmdline_file.read()
+		cmdline_file.close()
+	except IOError:
+		return None
+	return cmdline.split('\0')
+
+# A zombie (e.g. a shell of the deployer not yet reaped) is not alive
+def process_alive(pid):
+	try:
+		stat_file = open("/proc/%d/stat" % pid)
+		stat = stat_file.read()
+		stat_file.close()
+	except IOError:
+		return False
+	return stat[stat.rfind(')') + 2] != 'Z'
+
+# The daemon is checked by its name and by the dir of its pidfile, every
+# daemon has the configuration dir of its node in the command line
+def is_daemon(pid, name, pidfile):
+	cmdline = process_cmdline(pid)
+	if cmdline == None:
+		return False
+	path = os.path.dirname(pidfile) + "/"
+	return any(os.path.basename(arg) == name for arg in cmdline) and any(path in arg for arg in cmdline)
+
+# The shells of the nodes are started as "bash ... mininet:<name>"
+def is_shell(pid, name):
+	cmdline = process_cmdline(pid)
+	return cmdline != None and ("mininet:" + name) in cmdline
+
+def signal_process(pid, sig, group=False):
+	try:
+		if group:
+			os.killpg(pid, sig)
+		else:
+			os.kill(pid, sig)
+	except OSError:
+		pass
+
+# Sends sig to the processes and waits for them, the ones still alive after
+# KILL_TIMEOUT are killed. The shells ignore SIGTERM, they get a SIGHUP to
+# their process group as Mininet does
+def kill_processes(pids, what, sig=signal.SIGTERM, group=False):
+	if len(pids) == 0:
+		return
+	print "*** Killing %s %s" % (len(pids), what)
+	for pid in pids:
+		signal_process(pid, sig, group)
+	start = time.time()
+	alive = [pid for pid in pids if process_alive(pid)]
+	while len(alive) > 0 and time.time() - start < KILL_TIMEOUT:
+		time.sleep(0.05)
+		alive = [pid for pid in alive if process_alive(pid)]
+	for pid in alive:
+		print "*** WARNING Process %s Still Alive, Sending SIGKILL" % pid
+		signal_process(pid, signal.SIGKILL, group)
+
+# Resources of a node released by a worker of the teardown
+class NodeResources:
+
+	def __init__(self, name):
+		self.name = name
+		self.mounts = []
+		self.dirs = []
+
+def release_node(resources, mounts):
+	for path in resources.mounts:
+		unmountAll(path, mounts)
+	for path in resources.dirs:
+		remove_tree(path)
+
+# Releases the resources of the records: the daemons and then the shells of the
+# nodes are killed (the interfaces in their namespaces go with them), then the
+# bridges and the interfaces of the root namespace are deleted; the bind mounts
+# and the dirs are released by at most workers workers, a node for each of them
+def teardown(records, workers=1):
+	daemons = {}
+	shells = {}
+	nodes = {}
+	bridges = []
+	intfs = []
+	files = []
+	for entry in records:
+		kind = entry['kind']
+		if kind == 'daemon':
+			daemon = daemons.setdefault(entry['pidfile'], [entry['name'], set()])
+			if entry.get('pid') != None:
+				daemon[1].add(entry['pid'])
+		elif kind == 'node':
+			if entry.get('pid') != None:
+				shells[entry['pid']] = entry['name']
+		elif kind == 'mounts':
+			nodes.setdefault(entry['node'], NodeResources(entry['node'])).mounts.append(entry['path'])
+		elif kind == 'dir':
+			nodes.setdefault(entry['node'], NodeResources(entry['node'])).dirs.append(entry['path'])
+		elif kind == 'bridge' and entry['name'] not in bridges:
+			bridges.append(entry['name'])
+		elif kind == 'intf' and entry['name'] not in intfs:
+			intfs.append(entry['name'])
+		elif kind == 'file' and entry['path'] not in files:
+			files.append(entry['path'])
+	pids = set()
+	for (pidfile, (name, recorded)) in daemons.iteritems():
+		pid = read_pidfile(pidfile)
+		if pid != None:
+			recorded.add(pid)
+		pids.update([pid for pid in recorded if is_daemon(pid, name, pidfile)])
+	kill_processes(sorted(pids), "Daemons")
+	kill_processes(sorted([pid for (pid, name) in shells.iteritems() if is_shell(pid, name)]), "Node Shells", signal.SIGHUP, True)
+	if len(bridges) > 0:
+		print "*** Deleting %s Bridges" % len(bridges)
+		errRun("ovs-vsctl " + " -- ".join(["--if-exists del-br %s" % bridge for bridge in bridges]))
+	for intf in intfs:
+		errRun("ip link del %s" % intf)
+	print "*** Unmounting And Removing The Dirs Of %s Nodes" % len(nodes)
+	mounts = mountPoints()
+	run_tasks([(release_node, (nodes[name], mounts)) for name in sorted(nodes)], workers)
+	for path in files:
+		remove_file(path)
+
+# Releases the resources recorded in the journal of path, then removes it
+def cleanup_journal(path, workers=1):
+	print "*** Releasing The Resources Recorded In", path
+	teardown(load_journal(path), workers)
+	os.remove(path)
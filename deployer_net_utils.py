@@ -26,46 +26,106 @@
 #
 #
 
-sdn_subnet = [10, 0, 0, 0]
-sdn_netbit = 24
-loopback = [172, 168, 0, 0]
-# IP Parameter
-ip_subnet = [192, 168, 0, 0]
-ip_netbit = 24
+import sys
+from deployer_ipam import *
+
+# IP Parameter, the pools of the IP Address Management:
+# (network, netbit, prefix length of the blocks, reserved blocks)
+# OSHI and Controller loopbacks
+LOOPBACK_POOL = ("172.168.0.0", 16, 32, 1)
+# Multi-access OSPF networks, the first one is the controller's network
+OSPF_POOL = ("192.168.0.0", 16, 24, 1)
+# Point to point OSPF networks, the prefix length can be 30 or 31
+P2P_POOL = ("172.16.0.0", 12, 30, 0)
+# Virtual Leased Lines
+SDN_POOL = ("10.0.0.0", 8, 24, 1)
 # Round Robin index. It will used to split up the OSHI load
 next_ctrl = 0
 
+ipam = IPAM()
+
+# Addresses of the running deployment kept by a redeploy (see pin_addresses):
+# node -> loopback and (node1, node2, occurrence) -> point to point network
+pinned_loopbacks = {}
+pinned_p2p_nets = {}
+
+# (Re)creates the pools of the IPAM, the parameters have the format of the *_POOL
+def configure_ipam(loopback=LOOPBACK_POOL, ospf=OSPF_POOL, p2p=P2P_POOL, sdn=SDN_POOL):
+	ipam.pools = {}
+	ipam.add_pool("Loopback", *loopback)
+	ipam.add_pool("OSPF", *ospf)
+	ipam.add_pool("P2P", *p2p)
+	ipam.add_pool("SDN", *sdn)
+
+configure_ipam()
 
 def give_me_next_loopback():
-	loopback[3] = (loopback[3] + 1) % 256
-	if loopback[3] == 0:
-		loopback[2] = (loopback[2] + 1) % 256
-		if loopback[2] == 0:
-			loopback[1] = (loopback[1] + 1) % 256
-	if loopback[1] == 255 and loopback[2] == 255 and loopback[3] == 255:
-		print "Loopback Address Sold Out"
-		sys.exit(-2)
-	return "%s.%s.%s.%s" %(loopback[0],loopback[1],loopback[2],loopback[3])
+	return int_to_ip(ipam.pool("Loopback").allocate())
+
+# Bulk allocation of the loopbacks of n nodes
+def give_me_next_loopbacks(n):
+	return [int_to_ip(block) for block in ipam.pool("Loopback").allocate_many(n)]
+
+# Loopbacks of the nodes (names), the pinned ones are kept if still available
+def give_me_loopbacks(names):
+	return [int_to_ip(block) for block in allocate_pinned(ipam.pool("Loopback"), names, pinned_loopbacks)]
+
+# Point to point networks of the links (node1, node2), the pinned ones are kept
+# if still available
+def give_me_p2p_nets(links):
+	keys = []
+	occurrences = {}
+	for link in links:
+		occurrences[link] = occurrences.get(link, -1) + 1
+		keys.append(link + (occurrences[link],))
+	return [int_to_octets(block) for block in allocate_pinned(ipam.pool("P2P"), keys, pinned_p2p_nets)]
+
+# Allocates a block of the pool for each key: the pinned blocks are claimed
+# first, so that the other allocations do not take them
+def allocate_pinned(pool, keys, pinned):
+	blocks = {}
+	for key in keys:
+		if key in pinned and pool.claim(pinned[key]):
+			blocks[key] = pinned[key]
+	fresh = iter(pool.allocate_many(len(keys) - len(blocks)))
+	return [blocks[key] if key in blocks else next(fresh) for key in keys]
+
+# Pins the loopbacks (node -> address) and the point to point networks of the
+# links of a deployment, the next compilation keeps them
+def pin_addresses(loopbacks, nets):
+	pinned_loopbacks.clear()
+	pinned_p2p_nets.clear()
+	for (name, loopback) in loopbacks.iteritems():
+		if loopback != "0.0.0.0":
+			pinned_loopbacks[name] = ip_to_int(loopback)
+	occurrences = {}
+	for net in nets:
+		if net.pool == "P2P" and len(net.intfs) == 2:
+			link = (net.intfs[0].split('-')[0], net.intfs[1].split('-')[0])
+			occurrences[link] = occurrences.get(link, -1) + 1
+			pinned_p2p_nets[link + (occurrences[link],)] = ip_to_int(".".join([str(octet) for octet in net.subnet]))
 
 def give_me_next_ospf_net():
-	global ip_subnet
-	ip_subnet[2] = (ip_subnet[2] + 1) % 256
-	if ip_subnet[2] == 0:
-		print "Ip Subnet Address Sold Out"
-		sys.exit(-2)
-	return [ip_subnet[0], ip_subnet[1], ip_subnet[2], ip_subnet[3]]
+	return int_to_octets(ipam.pool("OSPF").allocate())
+
+def give_me_next_p2p_net():
+	return int_to_octets(ipam.pool("P2P").allocate())
+
+# Bulk allocation of the point to point networks of n links
+def give_me_next_p2p_nets(n):
+	return [int_to_octets(block) for block in ipam.pool("P2P").allocate_many(n)]
 
 def give_me_next_sdn_net():
-	global sdn_subnet
-	sdn_subnet[2] = (sdn_subnet[2] + 1) % 256
-	if sdn_subnet[2] == 0:
-		sdn_subnet[1] = (sdn_subnet[1] + 1) % 256
-	if sdn_subnet[1] == 255 and sdn_subnet[2] == 255:
-		print "SDN Subnet Address Sold Out"
-		sys.exit(-2)
-	return [sdn_subnet[0], sdn_subnet[1], sdn_subnet[2], sdn_subnet[3]]
+	return int_to_octets(ipam.pool("SDN").allocate())
+
+# Gives back the subnet (octets list) to its pool
+def release_net(pool, subnet):
+	ipam.pool(pool).release(ip_to_int(".".join([str(octet) for octet in subnet])))
 
 
+# L2 Access Network, besides the lists of nodes, links and interfaces it keeps
+# the indexes node -> interfaces and interface -> link, and the memoized path
+# node -> AOSHI, that is discarded when a link is added
 class L2AccessNetwork:
 
 	def __init__(self, name, classification):
@@ -78,58 +138,84 @@ class L2AccessNetwork:
 		else:
 			self.VlanIP = '0'
 		self.intfs = []
+		self.node_to_intfs = {}
+		self.intf_to_link = {}
+		self.aoshi_cache = {}
 
 	def addLink(self, l):
 		host1 = (l.intf1.name.split('-'))[0]
 		host2 = (l.intf2.name.split('-'))[0]
-		if host1 not in self.Nodes:
+		if host1 not in self.node_to_intfs:
 			self.Nodes.append(host1)
-		if host2 not in self.Nodes:
+			self.node_to_intfs[host1] = []
+		if host2 not in self.node_to_intfs:
 			self.Nodes.append(host2)
-		self.Links.append((l.intf1.name,l.intf2.name))
+			self.node_to_intfs[host2] = []
+		link = (l.intf1.name,l.intf2.name)
+		self.Links.append(link)
 		self.intfs.append(l.intf1.name)
 		self.intfs.append(l.intf2.name)
+		self.node_to_intfs[host1].append(l.intf1.name)
+		self.node_to_intfs[host2].append(l.intf2.name)
+		# The first link of the interface is the one used for the next hop
+		self.intf_to_link.setdefault(l.intf1.name, link)
+		self.intf_to_link.setdefault(l.intf2.name, link)
+		self.aoshi_cache = {}
+
+	def hasNode(self, node):
+		return node in self.node_to_intfs
 
 	def belong(self, name):
-		ret_intfs = []
-		for intf in self.intfs:
-			if name in intf:
-				ret_intfs.append(intf)
-		return ret_intfs
+		return list(self.node_to_intfs.get(name, []))
 
 	def getNextHop(self, node):
-		if node not in self.Nodes:
+		if node not in self.node_to_intfs:
 			return None
 		if 'euh' in node:
 			intfToFind = "%s-eth0" % node
-			for link in self.Links:
-				if intfToFind == link[0]:
-					return ((link[1].split("-"))[0], link[0], link[1])
-				elif intfToFind == link[1]:
-					return ((link[0].split("-"))[0], link[0], link[1])
 		elif 'sw' in node:
 			intfToFind = "%s-eth1" % node
-			for link in self.Links:
-				if intfToFind == link[0]:
-					return ((link[1].split("-"))[0], link[0], link[1])
-				elif intfToFind == link[1]:
-					return ((link[0].split("-"))[0], link[0], link[1])
-		elif 'aos' in node:
+		else:
 			return None
+		link = self.intf_to_link.get(intfToFind)
+		if link == None:
+			return None
+		if intfToFind == link[0]:
+			return ((link[1].split("-"))[0], link[0], link[1])
+		return ((link[0].split("-"))[0], link[0], link[1])
 
+	# Follows the next hops towards the AOSHI; the result is stored
+	# for all the nodes on the path
 	def getAoshi(self, node):
-		node = self.getNextHop(node)
-		while 'aos' not in node[0]:
-			node = self.getNextHop(node[0])
-	 	return node
+		path = []
+		hop = self.aoshi_cache.get(node)
+		while hop == None:
+			path.append(node)
+			hop = self.getNextHop(node)
+			if 'aos' in hop[0]:
+				break
+			node = hop[0]
+			hop = self.aoshi_cache.get(node)
+		for node in path:
+			self.aoshi_cache[node] = hop
+		return hop
 
 class OSPFNetwork: 
-	def __init__(self, intfs, ctrl, cost=1, hello_int=2, area="0.0.0.0"):
+	def __init__(self, intfs, ctrl, cost=1, hello_int=2, area="0.0.0.0", p2p=False, subnet=None):
 		self.intfs = intfs
 		if ctrl:
-			self.subnet = [192, 168, 0, 0]
+			self.pool = "OSPF"
+			self.subnet = int_to_octets(ipam.pool(self.pool).block(0))
+		elif p2p:
+			self.pool = "P2P"
+			if subnet == None:
+				subnet = give_me_next_p2p_net()
+			self.subnet = subnet
 		else :
+			self.pool = "OSPF"
 			self.subnet = give_me_next_ospf_net()
+		self.netbit = ipam.pool(self.pool).prefixlen
+		self.hosts = 0
 		self.cost = cost
 		self.hello_int = hello_int
 		self.area = area
@@ -144,20 +230,25 @@ class OSPFNetwork:
 	def belong(self, name):
 		ret_intfs = []
 		for intf in self.intfs:
-			if name in intf:
+			if intf.split('-')[0] == name:
 				ret_intfs.append(intf)
 		return ret_intfs
 
+	def prefix(self):
+		return "%s.%s.%s.%s/%s" % (self.subnet[0], self.subnet[1], self.subnet[2], self.subnet[3], self.netbit)
+
+	def gateway(self):
+		return host_address(self.subnet, self.netbit, 1)
+
 	def give_me_next_ip(self):
-		self.subnet[3] = self.subnet[3] + 1
-		if self.subnet == 255:
-			print "Error, Reached " + self.subnet
-			sys.exit(2)
-		return "%s.%s.%s.%s" % (self.subnet[0], self.subnet[1], self.subnet[2], self.subnet[3])
+		self.hosts = self.hosts + 1
+		return host_address(self.subnet, self.netbit, self.hosts)
 
 class Tunnel:
 	def __init__(self):
 		self.subnet = give_me_next_sdn_net()
+		self.netbit = ipam.pool("SDN").prefixlen
+		self.hosts = 0
 		self.intfs = []
 
 	def add_intf(self, intf):
@@ -169,9 +260,34 @@ class Tunnel:
 			return name
 		return None
 
+	def prefix(self):
+		return "%s.%s.%s.%s/%s" % (self.subnet[0], self.subnet[1], self.subnet[2], self.subnet[3], self.netbit)
+
 	def give_me_next_ip(self):
-		self.subnet[3] = self.subnet[3] + 1
-		if self.subnet == 255:
-			print "Error, Reached " + self.subnet
-			sys.exit(2)
-		return "%s.%s.%s.%s" % (self.subnet[0], self.subnet[1], self.subnet[2], self.subnet[3])
+		self.hosts = self.hosts + 1
+		return host_address(self.subnet, self.netbit, self.hosts)
+
+# Inverted index of the deployment: node -> [(network, intf, tunnel)]. The entries
+# follow the order of nets and of their interfaces; tunnel is the first Tunnel
+# of the interface, None if the interface is not part of a Virtual Leased Line
+def build_node_index(nets, tunnels):
+	intf_to_tunnel = {}
+	for tunnel in tunnels:
+		for intf in tunnel.intfs:
+			intf_to_tunnel.setdefault(intf, tunnel)
+	index = {}
+	for net in nets:
+		for intf in net.intfs:
+			node = intf.split('-')[0]
+			index.setdefault(node, []).append((net, intf, intf_to_tunnel.get(intf)))
+	return index
+
+# Number of OSPF neighbors expected by each router (names), every router of
+# an OSPF network is a neighbor of the other routers of the same network
+def expected_neighbors(nets, routers):
+	expected = dict((router, 0) for router in routers)
+	for net in nets:
+		members = set([intf.split('-')[0] for intf in net.intfs if intf.split('-')[0] in expected])
+		for member in members:
+			expected[member] = expected[member] + len(members) - 1
+	return expected
@@ -0,0 +1,204 @@
+#!/usr/bin/python
+
+##############################################################################################
+# Copyright (C) 2014 Pier Luigi Ventre - (Consortium GARR and University of Rome "Tor Vergata")
+# Copyright (C) 2014 Giuseppe Siracusano, Stefano Salsano - (CNIT and University of Rome "Tor Vergata")
+# www.garr.it - www.uniroma2.it/netgroup - www.cnit.it
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Deployment Plan.
+#
+# @author Pier Luigi Ventre <pl.ventre@gmail.com>
+# @author Giuseppe Siracusano <a_siracusano@tin.it>
+# @author Stefano Salsano <stefano.salsano@uniroma2.it>
+#
+#
+
+# The deployer works in two stages: the topology builders and the compiler
+# work on a PlanNet, that has the part of the Mininet API used by the builders
+# but does not create anything, and produce a deployment plan (a dict of plain
+# data); the executor creates the Mininet network of the plan and applies the
+# configuration of each node. The interfaces are named like Mininet does, so
+# the names in the plan are the ones of the deployed network
+
+from collections import OrderedDict
+
+class PlanIntf:
+
+	def __init__(self, name, node, port):
+		self.name = name
+		self.node = node
+		self.port = port
+
+	def __str__(self):
+		return self.name
+
+	def __repr__(self):
+		return self.name
+
+class PlanLink:
+
+	def __init__(self, node1, node2, port1=None, port2=None):
+		self.intf1 = node1.addIntf(port1)
+		self.intf2 = node2.addIntf(port2)
+
+# Node of the plan, kind is 'host', 'switch' or 'ctrl'. The hosts count the ports
+# from 0, the switches from 1 (as in Mininet)
+class PlanNode:
+
+	def __init__(self, name, kind, loopback=None, ip=None, port=None):
+		self.name = name
+		self.kind = kind
+		self.loopback = loopback
+		self.ip = ip
+		self.port = port
+		self.nameToIntf = OrderedDict()
+		self.nextPort = 1 if kind == 'switch' else 0
+		# Port name -> OpenFlow port number, assigned by the compiler
+		self.ofports = {}
+
+	def addIntf(self, port=None):
+		if port == None:
+			port = self.nextPort
+		intf = PlanIntf("%s-eth%s" % (self.name, port), self, port)
+		self.nameToIntf[intf.name] = intf
+		self.nextPort = max(self.nextPort, port + 1)
+		return intf
+
+	def ofport(self, port):
+		return self.ofports[port]
+
+	def __str__(self):
+		return self.name
+
+	def __repr__(self):
+		return self.name
+
+# The links of a previous plan (see pin_ports) keep their ports, so that the
+# interfaces of the unchanged links have the same names
+class PlanNet:
+
+	def __init__(self, previous_links=[]):
+		self.hosts = []
+		self.switches = []
+		self.controllers = []
+		self.links = []
+		self.nameToNode = {}
+		# (node1, node2, occurrence) -> (port1, port2) and node -> first free port
+		self.pinned_ports = {}
+		self.next_ports = {}
+		self.occurrences = {}
+		self.pin_ports(previous_links)
+
+	def pin_ports(self, links):
+		occurrences = {}
+		for (node1, node2, port1, port2) in links:
+			occurrences[(node1, node2)] = occurrences.get((node1, node2), -1) + 1
+			self.pinned_ports[(node1, node2, occurrences[(node1, node2)])] = (port1, port2)
+			self.next_ports[node1] = max(self.next_ports.get(node1, 0), port1 + 1)
+			self.next_ports[node2] = max(self.next_ports.get(node2, 0), port2 + 1)
+
+	def addNode(self, node, nodes):
+		node.nextPort = max(node.nextPort, self.next_ports.get(node.name, 0))
+		nodes.append(node)
+		self.nameToNode[node.name] = node
+		return node
+
+	def addHost(self, name, loopback=None):
+		return self.addNode(PlanNode(name, 'host', loopback=loopback), self.hosts)
+
+	def addSwitch(self, name):
+		return self.addNode(PlanNode(name, 'switch'), self.switches)
+
+	def addController(self, name, ip, port):
+		return self.addNode(PlanNode(name, 'ctrl', ip=ip, port=port), self.controllers)
+
+	def addLink(self, node1, node2):
+		pair = (node1.name, node2.name)
+		self.occurrences[pair] = self.occurrences.get(pair, -1) + 1
+		(port1, port2) = self.pinned_ports.get(pair + (self.occurrences[pair],), (None, None))
+		if "%s-eth%s" % (node1.name, port1) in node1.nameToIntf or "%s-eth%s" % (node2.name, port2) in node2.nameToIntf:
+			(port1, port2) = (None, None)
+		link = PlanLink(node1, node2, port1, port2)
+		self.links.append(link)
+		return link
+
+	def getNodeByName(self, name):
+		return self.nameToNode[name]
+
+# Configuration of a node: workdir is recreated (if any) with dirs, then the
+# files are written and the commands run in the namespace of the node; start
+# runs when all the nodes are configured (e.g. the daemons), stop undoes the
+# configuration of a running node (e.g. before it is applied again); pidfiles
+# are the (daemon, pidfile) of the daemons of the node (see deployer_journal).
+# sections split the files and the commands (see config_section), intfs are the
+# parts bound to the interfaces (see intf_config) and update is None if the
+# running node cannot be changed in place (see new_update)
+def new_config(workdir=None):
+	return {'workdir':workdir, 'dirs':[], 'files':[], 'commands':[], 'start':[], 'stop':[], 'pidfiles':[],
+		'sections':[], 'intfs':{}, 'update':None}
+
+# Starts the section name of the configuration: the files and the commands
+# added next, up to the following section, are applied in the profiling phase
+# name (see config_sections)
+def config_section(config, name):
+	config['sections'].append((name, len(config['files']), len(config['commands'])))
+
+# Part of the configuration bound to the interface intf (they are in commands
+# and stop too): the OVS ports created by the ovs-vsctl commands ovs, the
+# commands that configure the interface and the ones that undo them
+def intf_config(config, intf):
+	return config['intfs'].setdefault(intf, {'ports':[], 'ovs':[], 'commands':[], 'stop':[]})
+
+# Parts of the configuration changed in place by compile_update: base are the
+# settings that need the whole configuration when they change (e.g. the
+# controller of the bridge), ovsdb the ovs-vsctl invocation of the bridge,
+# flows its [bridge, rules file, mode] (see compile_flows), sysctl the file of
+# the kernel parameters and quagga the dir of the Quagga configuration files
+def new_update():
+	return {'base':[], 'ovsdb':None, 'flows':None, 'sysctl':None, 'quagga':None}
+
+# Nodes of a plan, name -> (kind, loopback, controller ip, controller port)
+def plan_nodes(plan):
+	nodes = {}
+	for (name, loopback) in plan['hosts']:
+		nodes[name] = ('host', loopback, None, None)
+	for name in plan['switches']:
+		nodes[name] = ('switch', None, None, None)
+	for (name, ip, port) in plan['ctrls']:
+		nodes[name] = ('ctrl', None, ip, port)
+	return nodes
+
+# Differences between a running plan and a new one: the nodes to remove and to
+# add (a node that changed kind or loopback is replaced), the links to remove and
+# to add, the nodes whose configuration changed (they are changed in place or
+# configured again, see compile_update) and whether the root commands and the
+# Vll Pusher configuration changed
+def plan_diff(old, new):
+	old_nodes = plan_nodes(old)
+	new_nodes = plan_nodes(new)
+	diff = {}
+	diff['removed_nodes'] = sorted([name for name in old_nodes if old_nodes[name] != new_nodes.get(name)])
+	diff['added_nodes'] = sorted([name for name in new_nodes if new_nodes[name] != old_nodes.get(name)])
+	replaced = set(diff['removed_nodes'])
+	old_links = set([link for link in old['links'] if link[0] not in replaced and link[1] not in replaced])
+	new_links = set(new['links'])
+	diff['removed_links'] = [link for link in old['links'] if link not in new_links]
+	diff['added_links'] = [link for link in new['links'] if link not in old_links]
+	diff['changed_nodes'] = sorted([name for name in new['configs'] if name not in diff['added_nodes'] and
+		old['configs'].get(name) != new['configs'][name]])
+	diff['root'] = old['root'] != new['root']
+	diff['vll_pusher'] = old['vll_pusher'] != new['vll_pusher']
+	return diff
@@ -0,0 +1,223 @@
+#!/usr/bin/python
+
+##############################################################################################
+# Copyright (C) 2014 Pier Luigi Ventre - (Consortium GARR and University of Rome "Tor Vergata")
+# Copyright (C) 2014 Giuseppe Siracusano, Stefano Salsano - (CNIT and University of Rome "Tor Vergata")
+# www.garr.it - www.uniroma2.it/netgroup - www.cnit.it
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Deployer Profiler.
+#
+# @author Pier Luigi Ventre <pl.ventre@gmail.com>
+# @author Giuseppe Siracusano <a_siracusano@tin.it>
+# @author Stefano Salsano <stefano.salsano@uniroma2.it>
+#
+#
+
+# Records the wall time of the deployment phases and the latency of the
+# commands run through Node.cmd (per command type and per node). The phases
+# can be nested and can run in the configuration workers, a phase entered by
+# a worker is nested in the phase of the main thread. The report is a json
+# file, the trace is in the collapsed stack format of the flame graphs
+# (phase;...;command type;node microseconds)
+
+import os
+import json
+import time
+import platform
+import threading
+from contextlib import contextmanager
+
+# Upper bounds (ms) of the buckets of the latency histograms
+HISTOGRAM_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+# For these tools the command type includes the subcommand, e.g. "ovs-vsctl add-br"
+SUBCOMMAND_TOOLS = ['ovs-vsctl', 'ovs-ofctl', 'ip', 'service']
+
+# The active profiler, None if the profiling is disabled
+profiler = None
+
+# Command type of a shell command line: the executable (without path and
+# environment assignments) and, for some tools, the subcommand. The commands
+# of a pipelined command line (see OSHI.cmdPipeline) are recorded one by one,
+# the line has the type of the rest of its round-trip (see Profiler.record_pipeline)
+def command_type(command):
+	tokens = command.split()
+	while len(tokens) > 0 and '=' in tokens[0] and not tokens[0].startswith('-'):
+		tokens = tokens[1:]
+	if len(tokens) == 0:
+		return "empty"
+	if tokens[0] == '{':
+		return "pipeline"
+	tool = os.path.basename(tokens[0])
+	if tool in SUBCOMMAND_TOOLS:
+		for token in tokens[1:]:
+			if not token.startswith('-'):
+				return "%s %s" % (tool, token)
+	return tool
+
+def histogram_bucket(elapsed):
+	ms = elapsed * 1000
+	for bound in HISTOGRAM_BUCKETS:
+		if ms <= bound:
+			return "<=%sms" % bound
+	return ">%sms" % HISTOGRAM_BUCKETS[-1]
+
+class Profiler:
+
+	def __init__(self):
+		self.start = time.time()
+		self.lock = threading.Lock()
+		self.local = threading.local()
+		self.main_stack = []
+		# Phase path -> [count, total, first start, last end]
+		self.phases = {}
+		# Command type -> [count, total, max, histogram]
+		self.commands = {}
+		# Node -> [count, total]
+		self.nodes = {}
+		# Collapsed stack -> total
+		self.stacks = {}
+
+	# Phases entered by the current thread, the ones of a worker are nested
+	# in the phases of the main thread
+	def local_stack(self):
+		if threading.current_thread().name == 'MainThread':
+			return self.main_stack
+		if getattr(self.local, 'stack', None) == None:
+			self.local.stack = []
+		return self.local.stack
+
+	def path(self, names=[]):
+		stack = self.local_stack()
+		if stack is not self.main_stack:
+			stack = self.main_stack + stack
+		return ";".join(stack + names)
+
+	def enter(self, name):
+		self.local_stack().append(name)
+		return time.time()
+
+	def exit(self, start):
+		end = time.time()
+		path = self.path()
+		self.local_stack().pop()
+		self.lock.acquire()
+		entry = self.phases.setdefault(path, [0, 0.0, start, end])
+		entry[0] = entry[0] + 1
+		entry[1] = entry[1] + end - start
+		entry[2] = min(entry[2], start)
+		entry[3] = max(entry[3], end)
+		self.lock.release()
+
+	def record_cmd(self, node, command, elapsed):
+		self.record(node, command_type(command), elapsed)
+
+	# Records the commands of a pipelined command line sent at start and
+	# answered at end, [(command, timestamp of its marker)] in order: a command
+	# ends at its timestamp and starts at the one before (the first when the
+	# line is sent). The rest of the round-trip (the prompt) is a "pipeline"
+	def record_pipeline(self, node, commands, start, end):
+		last = start
+		for (command, stamp) in commands:
+			stamp = min(max(stamp, last), end)
+			self.record_cmd(node, command, stamp - last)
+			last = stamp
+		self.record(node, "pipeline", end - last)
+
+	def record(self, node, kind, elapsed):
+		path = self.path([kind, node])
+		self.lock.acquire()
+		entry = self.commands.setdefault(kind, [0, 0.0, 0.0, {}])
+		entry[0] = entry[0] + 1
+		entry[1] = entry[1] + elapsed
+		entry[2] = max(entry[2], elapsed)
+		bucket = histogram_bucket(elapsed)
+		entry[3][bucket] = entry[3].get(bucket, 0) + 1
+		entry = self.nodes.setdefault(node, [0, 0.0])
+		entry[0] = entry[0] + 1
+		entry[1] = entry[1] + elapsed
+		self.stacks[path] = self.stacks.get(path, 0.0) + elapsed
+		self.lock.release()
+
+	def report(self):
+		phases = {}
+		for (path, (count, total, start, end)) in self.phases.iteritems():
+			phases[path] = {'count':count, 'total_s':total, 'wall_s':end - start, 'start_s':start - self.start}
+		commands = {}
+		for (kind, (count, total, longest, histogram)) in self.commands.iteritems():
+			commands[kind] = {'count':count, 'total_s':total, 'max_s':longest, 'mean_s':total / count, 'histogram':histogram}
+		nodes = {}
+		for (node, (count, total)) in self.nodes.iteritems():
+			nodes[node] = {'count':count, 'total_s':total}
+		return {
+			'python':platform.python_version(),
+			'date':time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.start)),
+			'total_s':time.time() - self.start,
+			'phases':phases,
+			'commands':commands,
+			'nodes':nodes
+		}
+
+	def write_report(self, path):
+		report_file = open(path, 'w')
+		json.dump(self.report(), report_file, sort_keys=True, indent=2)
+		report_file.write('\n')
+		report_file.close()
+		print "*** Profiling Report Written To", path
+
+	def write_trace(self, path):
+		trace_file = open(path, 'w')
+		for path_stack in sorted(self.stacks):
+			trace_file.write("%s %d\n" % (path_stack.replace(' ', '_'), self.stacks[path_stack] * 1000000))
+		trace_file.close()
+		print "*** Profiling Trace Written To", path
+
+# Enables the profiling, Node.cmd is wrapped to record every command
+def enable_profiling():
+	global profiler
+	from mininet.node import Node
+	profiler = Profiler()
+	cmd = Node.cmd
+	def profiled_cmd(self, *args, **kwargs):
+		command = " ".join([str(arg) for arg in args])
+		# The pipelined command lines are recorded by record_pipeline
+		if command_type(command) == "pipeline":
+			return cmd(self, *args, **kwargs)
+		start = time.time()
+		try:
+			return cmd(self, *args, **kwargs)
+		finally:
+			profiler.record_cmd(self.name, command, time.time() - start)
+	Node.cmd = profiled_cmd
+	return profiler
+
+# Records the commands of a pipelined command line (see Profiler.record_pipeline),
+# it does nothing if the profiling is disabled
+def record_pipeline(node, commands, start, end):
+	if profiler != None:
+		profiler.record_pipeline(node, commands, start, end)
+
+# Records the wall time of the enclosed block as the phase name, nested in the
+# current phase; it does nothing if the profiling is disabled
+@contextmanager
+def phase(name):
+	if profiler == None:
+		yield
+		return
+	start = profiler.enter(name)
+	try:
+		yield
+	finally:
+		profiler.exit(start)
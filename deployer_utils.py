@@ -26,7 +26,14 @@
 #
 #
 
+import os
+import re
+import sys
+import time
+import shutil
+import traceback
 from os.path import realpath
+from multiprocessing.pool import ThreadPool
 from mininet.util import errFail, quietRun, errRun
 from mininet.log import debug, info
 
@@ -49,15 +56,18 @@ def mountPoints():
         mounts.append( mount )
     return mounts
 
-# Utility Function for unmount all the dirs
-def unmountAll( rootdir=MNRUNDIR ):
+# Utility Function for unmount all the dirs, mounts is the list of the mounted
+# points if it has already been read (see mountPoints)
+def unmountAll( rootdir=MNRUNDIR, mounts=None ):
     "Unmount all mounts under a directory tree"
     rootdir = realpath( rootdir )
+    if mounts is None:
+        mounts = mountPoints()
     # Find all mounts below rootdir
     # This is subtle because /foo is not
     # a parent of /foot
     dirslash = rootdir + '/'
-    mounts = [ m for m in mountPoints()
+    mounts = [ m for m in mounts
               if m == dir or m.find( dirslash ) == 0 ]
     # Unmount them from bottom to top
     mounts.sort( reverse=True )
@@ -68,6 +78,20 @@ def unmountAll( rootdir=MNRUNDIR ):
             info( '*** Warning: failed to umount', mount, '\n' )
             info( err )
 
+# Changes of the host file system made by the deployer, the dry run replaces
+# them with ones confined to its sandbox (as it does with open)
+
+def make_dir(path):
+	os.mkdir(path)
+
+def remove_tree(path):
+	shutil.rmtree(path, ignore_errors=True)
+
+# A missing file is not an error
+def remove_file(path):
+	if os.path.exists(path):
+		os.remove(path)
+
 def fixIntf(hosts):
 	for i in range(0, len(hosts)):
 		for obj in hosts[i].nameToIntf:
@@ -104,12 +128,131 @@ def strip_number(intf):
 		sys.exit(-1)
 	return int(a[1][3:])
 
-def strip_ip(oshi):
+# Provides the commands that remove the address of the first interface of the node
+def compile_strip_ip(oshi):
+	commands = []
 	for intf in oshi.nameToIntf:
 		if 'lo' not in intf:
 			if 'eth0' in intf:
-				oshi.cmd("ifconfig " + intf + " 0")
+				commands.append("ifconfig " + intf + " 0")
+	return commands
+
+# Runs the tasks (function, args), at most workers at the same time. The
+# failures are collected and reported together at the end, then the
+# deployer exits. The first argument of each task is the node
+def run_tasks(tasks, workers=1):
+	failures = []
+	def run(task):
+		(function, args) = task
+		try:
+			function(*args)
+		except (Exception, SystemExit):
+			failures.append((args[0].name, function.__name__, traceback.format_exc()))
+	if workers > 1 and len(tasks) > 1:
+		pool = ThreadPool(min(workers, len(tasks)))
+		pool.map(run, tasks)
+		pool.close()
+		pool.join()
+	else:
+		for task in tasks:
+			run(task)
+	if len(failures) > 0:
+		print "*** Configuration Failed For %s Nodes" % len(failures)
+		for (name, function, error) in failures:
+			print "*** %s - %s:" % (name, function)
+			print error
+		sys.exit(-2)
+
+# Max time (seconds) waited for a condition of the host
+READY_TIMEOUT = 30
+
+# Polls condition until it holds or timeout expires, the waited time is logged.
+# Returns True if the condition holds
+def wait_for(what, condition, timeout=READY_TIMEOUT, interval=0.1):
+	start = time.time()
+	while True:
+		if condition():
+			print "*** Waited %.2fs For %s" % (time.time() - start, what)
+			return True
+		if time.time() - start > timeout:
+			print "*** WARNING Timeout Waiting For %s After %.2fs" % (what, time.time() - start)
+			return False
+		time.sleep(interval)
+
+# Readiness probes, node is the shell of the root namespace
+
+def processes_gone(node, names):
+	return node.cmd("pgrep -x '%s'" % "|".join(names)).strip() == ""
+
+def network_manager_active(node):
+	out = node.cmd("service network-manager status")
+	return "running" in out and "not running" not in out
+
+def ovs_ready(node):
+	return node.cmd("ovs-vsctl --timeout=1 show > /dev/null 2>&1 && echo ready").strip() == "ready"
+
+# Max number of nodes polled at the same time by poll_nodes
+POLL_WORKERS = 16
+
+# Polls probe(node) on all the nodes until it holds for each of them or timeout
+# expires; every round polls the pending nodes in parallel. Returns node name ->
+# seconds before the probe held, None for the nodes not ready at the timeout
+def poll_nodes(nodes, probe, timeout=READY_TIMEOUT, interval=0.5, workers=POLL_WORKERS):
+	start = time.time()
+	times = dict((node.name, None) for node in nodes)
+	pending = list(nodes)
+	pool = ThreadPool(max(1, min(workers, len(nodes))))
+	while len(pending) > 0:
+		results = pool.map(probe, pending)
+		now = time.time() - start
+		for (node, ready) in zip(pending, results):
+			if ready:
+				times[node.name] = now
+		pending = [node for node in pending if times[node.name] == None]
+		if len(pending) == 0 or now > timeout:
+			break
+		time.sleep(interval)
+	pool.close()
+	pool.join()
+	return times
+
+def print_poll_report(what, times):
+	for name in sorted(times):
+		if times[name] != None:
+			print "*** %s: %s After %.2fs" % (name, what, times[name])
+		else:
+			print "*** WARNING %s: Not %s At The Timeout" % (name, what)
+	ready = [t for t in times.values() if t != None]
+	if len(ready) > 0:
+		print "*** %s/%s Nodes %s, Total %.2fs" % (len(ready), len(times), what, max(ready))
 
+# Quagga probes, the vty sockets of the daemons are in the private /var/run/quagga
 
+def quagga_ready(node):
+	return node.cmd("test -S /var/run/quagga/zebra.vty && test -S /var/run/quagga/ospfd.vty && echo ready").strip() == "ready"
 
+# Provides the OSPF adjacencies (Full, or 2-Way between DROther routers) and
+# the destinations of the installed OSPF routes of the node
+def ospf_state(node):
+	out = node.cmd("VTYSH_PAGER=cat vtysh -c 'show ip ospf neighbor' -c 'show ip route ospf'")
+	adjacencies = 0
+	routes = set()
+	for line in out.split('\n'):
+		fields = line.split()
+		if len(fields) > 2 and (fields[2].startswith("Full/") or fields[2] == "2-Way/DROther"):
+			adjacencies = adjacencies + 1
+		match = re.match(r'O>\*\s+(\S+)/', line)
+		if match:
+			routes.add(match.group(1))
+	return (adjacencies, routes)
 
+# The node is converged when it has the expected adjacencies and the routes
+# towards the loopbacks (router name -> address) of all the other routers
+def ospf_converged(node, neighbors, loopbacks):
+	(adjacencies, routes) = ospf_state(node)
+	if adjacencies < neighbors:
+		return False
+	for (name, lo) in loopbacks.iteritems():
+		if name != node.name and lo not in routes:
+			return False
+	return True
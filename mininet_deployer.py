@@ -46,11 +46,13 @@ from oshi import *
 from deployer_utils import *
 from deployer_net_utils import *
 from deployer_configuration_utils import *
+from deployer_cache import *
+from deployer_profiler import *
+from deployer_plan import *
+from deployer_journal import *
 
 from functools import partial
-import subprocess
 import os
-import shutil
 import sys
 import argparse
 
@@ -89,8 +91,30 @@ RHS_tunnel_vlan = []
 TRUNK_TO_TAG = {}
 ACCESS_TO_TAG = {}
 AOSHI_TO_TAG = {}
+# Node -> [(OSPF network, interface, tunnel)], built by compile_plan
+node_index = {}
 
 verbose = True
+# Reuse the cached plans of the topology files
+use_cache = True
+# Max number of nodes configured concurrently
+config_workers = 1
+# How the OSHI rules are installed, see FLOWS_MODES
+flows_mode = 'add'
+# Output files of the profiling (json report and flame graph trace), None disables them
+profile_path = None
+trace_path = None
+# Max time (seconds) waited for the Quagga daemons and the OSPF convergence, 0 does not wait
+convergence_timeout = 120
+# Journal of the resources of the deployment, see deployer_journal
+journal_path = JOURNAL_PATH
+# Only release the resources of a crashed run
+cleanup_only = False
+# Plan applied to the running network and its nodes (name -> node), see init_net
+running_plan = None
+live_nodes = {}
+# Links (with ports) of the running network kept by a redeploy, see redeploy
+pinned_links = []
 	  		
 def check_tunnel_configuration():
 	for i in range(0,len(LHS_tunnel)):
@@ -118,7 +142,7 @@ def SDN_tunnel_setup_oneside(net, side):
 		print "*** SDN Setup For", host
 		nextHop = None
 		i = 0
-		while host not in L2nets[i].Nodes:
+		while not L2nets[i].hasNode(host):
 			i = i + 1
 		if i == len(L2nets):
 			print "Configuration Error"
@@ -201,7 +225,7 @@ def IP_tunnel_setup():
 		print "*** IP Setup For", host
 		nextHop = None
 		i = 0
-		while host not in L2nets[i].Nodes:
+		while not L2nets[i].hasNode(host):
 			i = i + 1
 		if i == len(L2nets):
 			print "Configuration Error"
@@ -236,17 +260,19 @@ def IP_tunnel_setup():
 				print "Tunnel Setup Cannot Work Properly"
 				sys.exit(-2)
 
-def configure_l2_accessnetwork():
+# Provides the ovs-vsctl commands (see ovs_vsctl_batch) of the access and trunk ports
+def compile_l2_accessnetwork():
 	print "*** Configure L2 Access Networks"
-	root = Node( 'root', inNamespace=False )
+	commands = []
 	print "*** Configure L2 Access Ports" 
 	for key, value in ACCESS_TO_TAG.iteritems():
 		print "*** Configure", key, "As Access Port, TAG=", value
-		root.cmd("ovs-vsctl set port %s tag=%s" %(key, value))
+		commands.append("set port %s tag=%s" %(key, value))
 	print "*** Configure L2 Trunk Ports"
 	for key, value in TRUNK_TO_TAG.iteritems():
 		print "*** Configure", key, "As Trunk Port, TAG=", value
-		root.cmd("ovs-vsctl set port %s trunks=%s" %(key, value))
+		commands.append("set port %s trunks=%s" %(key, value))
+	return commands
 			
 def create_access_network(net):
 	print "*** Create Access Networks"
@@ -257,7 +283,7 @@ def create_access_network(net):
 	for i in range(OSHI, (2*OSHI)):
 		aoshi = (net.addHost('aos%s' % (i+1), loopback = give_me_next_loopback()))
 		l = net.addLink(aoshi, oshis[i % OSHI])
-		nets.append(OSPFNetwork(intfs=[l.intf1.name,l.intf2.name], ctrl=False))
+		nets.append(OSPFNetwork(intfs=[l.intf1.name,l.intf2.name], ctrl=False, p2p=True))
 		print "*** Connect", aoshi, "To", oshis[i % OSHI]
 		create_l2_access_network(aoshi, net)   
 		aoshis.append(aoshi)
@@ -270,12 +296,10 @@ def create_l2_access_network(aoshi, net, n_host=1):
 	l2net = L2AccessNetwork(name, classification = 'B')
 	print "*** Create L2 Access Network For", aoshi.name
 	intfs = []
-	hosts_in_rn = []
 	print "*** Create L2 Switch"
 	next = len(switches)
 	sw = net.addSwitch("sw%s" % (next+1))
 	print "*** Create Switch", sw.name
-	hosts_in_rn.append(sw)
 	l = net.addLink(sw, aoshi)
 	print "*** Connect", sw, "To", aoshi
 	l2net.addLink(l)
@@ -287,7 +311,6 @@ def create_l2_access_network(aoshi, net, n_host=1):
 	# next = len(switches)
 	# print "*** Create Switch", sw.name
 	# sw = net.addSwitch("sw%s" % (next+1))
-	# hosts_in_rn.append(sw)
 	# l = net.addLink(sw, temp)
 	# print "*** Connect", sw, "To", temp
 	# l2net.addLink(l)
@@ -302,7 +325,6 @@ def create_l2_access_network(aoshi, net, n_host=1):
 		hosts.append(host.name)
 		intfs.append(l.intf1.name)
 	nets.append(OSPFNetwork(intfs, ctrl=False, hello_int=2))
-	fixIntf(hosts_in_rn)
 	L2nets.append(l2net)
 
 def buildTopoFromFile(param):
@@ -314,30 +336,42 @@ def buildTopoFromFile(param):
 
 	if verbose:
 		print "*** Build Topology From Parsed File"
-	parser = TopoParser(param, verbose=False)
-	(ppsubnets, l2subnets) = parser.getsubnets()
+	key = None
+	path_json = TopoParser.path + param
+	# A redeploy compiles with the addresses and the ports of the running network
+	if use_cache and len(pinned_links) == 0 and os.path.exists(path_json):
+		key = cache_key(path_json, get_cache_params())
+		plan = load_plan(key)
+		if plan != None:
+			print "*** Deployment Plan Loaded From Cache", key
+			return plan
+	with phase("parse"):
+		parser = TopoParser(param, verbose=False)
+		(ppsubnets, l2subnets) = parser.getsubnets()
 	set_oshis = parser.oshis
 	set_aoshis = parser.aoshis
 	set_l2sws = parser.l2sws
 	set_euhs = parser.euhs
-	hosts_in_rn = []
-	net = Mininet( controller=RemoteController, switch=OVSKernelSwitch, host=OSHI, build=False )
+	net = PlanNet(pinned_links)
+	# Bulk allocation of the loopbacks and of the point to point networks
+	loopbacks = iter(give_me_loopbacks(set_oshis + set_aoshis))
+	core_ppsubnets = [ppsubnet for ppsubnet in ppsubnets if ppsubnet.type == "CORE"]
+	p2p_nets = iter(give_me_p2p_nets([(ppsubnet.links[0][0], ppsubnet.links[0][1]) for ppsubnet in core_ppsubnets]))
 	if verbose:
 		print "*** Build OSHI"	
 	for oshi in set_oshis:
-		osh = net.addHost(oshi, loopback = give_me_next_loopback())
+		osh = net.addHost(oshi, loopback = next(loopbacks))
 		oshis.append(osh)
 	if verbose:
 		print "*** Build AOSHI"
 	for aoshi in set_aoshis:
-		aos = net.addHost(aoshi, loopback = give_me_next_loopback())
+		aos = net.addHost(aoshi, loopback = next(loopbacks))
 		aoshis.append(aos)
 	if verbose:
 		print "*** Build L2SWS"
 	for l2sw in set_l2sws:
 		sw = net.addSwitch(l2sw)
 		switches.append(sw)
-		hosts_in_rn.append(sw)
 	if verbose:
 		print "*** Build EUHS"
 	for euh in set_euhs:
@@ -353,7 +387,7 @@ def buildTopoFromFile(param):
 			node1 = net.getNodeByName(ppsubnet.links[0][0])
 			node2 = net.getNodeByName(ppsubnet.links[0][1])
 			l = net.addLink(node1, node2)
-			nets.append(OSPFNetwork(intfs=[l.intf1.name,l.intf2.name], ctrl=False))
+			nets.append(OSPFNetwork(intfs=[l.intf1.name,l.intf2.name], ctrl=False, p2p=True, subnet=next(p2p_nets)))
 			if verbose:			
 				print "*** Connect", node1.name, "To", node2.name
 		i = i + 1
@@ -431,17 +465,13 @@ def buildTopoFromFile(param):
 		i = i + 1	
 	
 	print "*** Creating controller"
-	c1 = RemoteController( 'c1', ip=ctrls_ip[0], port=ctrls_port[0])
+	c1 = net.addController('c1', ip=ctrls_ip[0], port=ctrls_port[0])
 	ctrls.append(c1)
-	hosts_in_rn.append(c1)
 
 	# Connect the controller to the network
 	print "*** Connect", osh.name, "To Controller"
 	l = net.addLink(osh, c1)
 	nets.append(OSPFNetwork(intfs=[l.intf1.name, l.intf2.name], ctrl=True))
-	
-	# Only needed for hosts in root namespace
-	fixIntf(hosts_in_rn)
 
 	# Utility function		
 	check_tunnel_configuration()
@@ -458,7 +488,7 @@ def buildTopoFromFile(param):
 
 	i = 0
 	for tunnel in tunnels :	
-		print "*** Tunnel %d, Subnet %s.%s.%s.%s, Intfs %s" % (i+1, tunnel.subnet[0], tunnel.subnet[1], tunnel.subnet[2], 0, tunnel.intfs)
+		print "*** Tunnel %d, Subnet %s, Intfs %s" % (i+1, tunnel.prefix(), tunnel.intfs)
 		i = i + 1
 
 	i = 0
@@ -479,8 +509,147 @@ def buildTopoFromFile(param):
 
 
 	for network in nets:
-		print "*** OSPF Network: %s.%s.%s.%s" % (network.subnet[0], network.subnet[1], network.subnet[2], 0), str(network.intfs) + ",", "cost %s," % network.cost, "hello interval %s," % network.hello_int
+		print "*** OSPF Network: %s" % network.prefix(), str(network.intfs) + ",", "cost %s," % network.cost, "hello interval %s," % network.hello_int
+
+	plan = compile_plan(net)
+	if key != None:
+		print "*** Store Deployment Plan In Cache", key
+		store_plan(key, plan)
+	return plan
+
+# The parameters that change the plan derived from a topology file
+def get_cache_params():
+	return (CORE_APPROACH, ctrls_ip, ctrls_port, LHS_tunnel, RHS_tunnel, ipam.config(), flows_mode, path_quagga_exec)
+
+# Provides the deployment plan of a built topology: the nodes and the links (in
+# creation order, so the interface names are the same), the addresses and the tags
+def get_plan(net):
+	plan = {}
+	plan['hosts'] = [(host.name, host.loopback) for host in net.hosts]
+	plan['switches'] = [sw.name for sw in net.switches]
+	plan['ctrls'] = [(ctrl.name, ctrl.ip, ctrl.port) for ctrl in ctrls]
+	plan['links'] = [(l.intf1.node.name, l.intf2.node.name, l.intf1.port, l.intf2.port) for l in net.links]
+	plan['oshis'] = [oshi.name for oshi in oshis]
+	plan['aoshis'] = [aoshi.name for aoshi in aoshis]
+	plan['euhs'] = list(hosts)
+	plan['ipam'] = ipam
+	plan['nets'] = list(nets)
+	plan['L2nets'] = list(L2nets)
+	plan['tunnels'] = list(tunnels)
+	plan['tags'] = (dict(TRUNK_TO_TAG), dict(ACCESS_TO_TAG), dict(AOSHI_TO_TAG))
+	plan['vlls'] = (list(LHS_tunnel_aoshi), list(RHS_tunnel_aoshi), list(LHS_tunnel_port), list(RHS_tunnel_port), list(LHS_tunnel_vlan), list(RHS_tunnel_vlan))
+	return plan
+
+# Compiles the deployment plan of a topology built on a PlanNet: the topology
+# (see get_plan) and the configuration of each node (see new_config), plus
+# the ovs-vsctl commands of the root namespace and the lines of the Vll Pusher
+# configuration. Nothing is executed, the plan is applied by init_net
+def compile_plan(net):
+	print "*** Compile The Deployment Plan"
+	# The topology is complete, index the interfaces of the nodes
+	global node_index
+	global next_ctrl
+	node_index = build_node_index(nets, tunnels)
+	next_ctrl = 0
+
+	# The controllers and the addresses are assigned in the node order
+	configs = {}
+	loopbacks = {}
+	for ctrl in ctrls:
+		addresses = allocate_addresses(ctrl)
+		loopbacks[ctrl.name] = addresses[1]
+		configs[ctrl.name] = compile_env_ctrl(ctrl, addresses)
+	for oshi in oshis + aoshis:
+		(ctrl_ip, ctrl_port) = next_controller()
+		addresses = allocate_addresses(oshi)
+		loopbacks[oshi.name] = addresses[1]
+		configs[oshi.name] = compile_env_oshi(oshi, ctrl_ip, ctrl_port, addresses)
+	for host in hosts:
+		configs[host] = compile_node(net.getNodeByName(host))
+
+	plan = get_plan(net)
+	plan['configs'] = configs
+	plan['loopbacks'] = loopbacks
+	plan['root'] = compile_standalone_sw(switches) + compile_l2_accessnetwork()
+	plan['vll_pusher'] = compile_vll_pusher(net)
+	return plan
+
+# Empties the topology globals
+def reset_topology():
+	for values in (oshis, aoshis, switches, ctrls, hosts, nets, L2nets, tunnels, LHS_tunnel_aoshi, RHS_tunnel_aoshi,
+		LHS_tunnel_port, RHS_tunnel_port, LHS_tunnel_vlan, RHS_tunnel_vlan):
+		del values[:]
+	for tags in (TRUNK_TO_TAG, ACCESS_TO_TAG, AOSHI_TO_TAG):
+		tags.clear()
+
+# Creates a node of the plan (see plan_nodes), the controllers are not part of
+# the Mininet network. The shell, the bind mounts and the bridge of the node
+# are recorded in the journal
+def add_node(net, name, params):
+	(kind, lo, ip, port) = params
+	if kind == 'host':
+		node = net.addHost(name, loopback = lo)
+	elif kind == 'switch':
+		node = net.addSwitch(name)
+		record('bridge', name=name)
+	else:
+		node = RemoteController( name, ip=ip, port=port)
+	record('node', name=name, pid=getattr(node, 'pid', None))
+	if isinstance(node, OSHI):
+		record('mounts', node=name, path=node.rundir)
+	return node
+
+# Creates a link of the plan, the interfaces of the root namespace are not
+# deleted with the namespaces and are recorded in the journal
+def add_link(net, node1, node2, port1, port2):
+	link = net.addLink(node1, node2, port1, port2)
+	if node1.inNamespace == False and node2.inNamespace == False:
+		record('intf', name=link.intf1.name)
+	return link
+
+# Builds the Mininet network of a plan, the topology globals are replaced
+# with the ones of the plan
+def buildTopoFromPlan(plan):
+	global live_nodes
+	reset_topology()
+	net = Mininet( controller=RemoteController, switch=OVSKernelSwitch, host=OSHI, build=False )
+	nodes = {}
+	node_params = plan_nodes(plan)
+	with phase("topology"):
+		for (name, lo) in plan['hosts']:
+			nodes[name] = add_node(net, name, node_params[name])
+		for name in plan['switches']:
+			nodes[name] = add_node(net, name, node_params[name])
+		for (name, ip, port) in plan['ctrls']:
+			nodes[name] = add_node(net, name, node_params[name])
+		for (lhs, rhs, port1, port2) in plan['links']:
+			add_link(net, nodes[lhs], nodes[rhs], port1, port2)
+		bind_plan(plan, nodes)
+		# Only needed for hosts in root namespace
+		fixIntf(switches + ctrls)
+	live_nodes = nodes
+	print "*** %s Nodes, %s Links, %s OSPF Networks, %s L2 Access Networks" % (len(nodes), len(plan['links']), len(nets), len(L2nets))
 	return net
+
+# Fills the topology globals with the plan and its nodes (name -> node)
+def bind_plan(plan, nodes):
+	for name in plan['switches']:
+		switches.append(nodes[name])
+	for (name, ip, port) in plan['ctrls']:
+		ctrls.append(nodes[name])
+	for name in plan['oshis']:
+		oshis.append(nodes[name])
+	for name in plan['aoshis']:
+		aoshis.append(nodes[name])
+	hosts.extend(plan['euhs'])
+	ipam.restore(plan['ipam'])
+	nets.extend(plan['nets'])
+	L2nets.extend(plan['L2nets'])
+	tunnels.extend(plan['tunnels'])
+	for (current, cached) in zip((TRUNK_TO_TAG, ACCESS_TO_TAG, AOSHI_TO_TAG), plan['tags']):
+		current.update(cached)
+	for (current, cached) in zip((LHS_tunnel_aoshi, RHS_tunnel_aoshi, LHS_tunnel_port, RHS_tunnel_port, LHS_tunnel_vlan, RHS_tunnel_vlan), plan['vlls']):
+		current.extend(cached)
 	
 def Mesh(OSHI_n=4):
 	global ctrls
@@ -491,7 +660,7 @@ def Mesh(OSHI_n=4):
 	"Create A Mesh Topo"
 	print "*** Mesh With", OSHI_n, "OSHI"
 	"Creating OSHI"
-	net = Mininet( controller=RemoteController, switch=OVSKernelSwitch, host=OSHI, build=False )
+	net = PlanNet()
 	i = 0
 	h = 0
 	print "*** Create Core Networks"
@@ -499,25 +668,20 @@ def Mesh(OSHI_n=4):
 		oshi = (net.addHost('osh%s' % (i+1), loopback = give_me_next_loopback()))
 		for rhs in oshis:
 			l = net.addLink(oshi, rhs)
-			nets.append(OSPFNetwork(intfs=[l.intf1.name,l.intf2.name], ctrl=False))
+			nets.append(OSPFNetwork(intfs=[l.intf1.name,l.intf2.name], ctrl=False, p2p=True))
 			print "*** Connect", oshi, "To", rhs   
 		oshis.append(oshi)
 
 	print "*** Creating controller"
 	#c0 = net.addController( 'c0', ip=ctrl_root_ip, port=ctrl_root_port )
-	c1 = RemoteController( 'c1', ip=ctrls_ip[0], port=ctrls_port[0])
+	c1 = net.addController('c1', ip=ctrls_ip[0], port=ctrls_port[0])
 	ctrls.append(c1)
-	
-	hosts_in_rn = []
-	hosts_in_rn.append(c1)
+
 	# Connect the controller to the network
 	print "*** Connect", oshi.name, "To Controller"
 	l = net.addLink(oshi, c1)
 	nets.append(OSPFNetwork(intfs=[l.intf1.name, l.intf2.name], ctrl=True))
-	
-	# Only needed for hosts in root namespace
-	fixIntf(hosts_in_rn)
-	
+
 	# Utility function
 	create_access_network(net)
 
@@ -536,7 +700,7 @@ def Mesh(OSHI_n=4):
 
 	i = 0
 	for tunnel in tunnels :	
-		print "*** Tunnel %d, Subnet %s.%s.%s.%s, Intfs %s" % (i+1, tunnel.subnet[0], tunnel.subnet[1], tunnel.subnet[2], 0, tunnel.intfs)
+		print "*** Tunnel %d, Subnet %s, Intfs %s" % (i+1, tunnel.prefix(), tunnel.intfs)
 		i = i + 1
 
 	i = 0
@@ -555,8 +719,8 @@ def Mesh(OSHI_n=4):
 	print "*** LHS Port:", LHS_tunnel_port
 	print "*** RHS Port:", RHS_tunnel_port
 	for network in nets:
-		print "*** OSPF Network: %s.%s.%s.%s" % (network.subnet[0], network.subnet[1], network.subnet[2], 0), str(network.intfs) + ",", "cost %s," % network.cost, "hello interval %s," % network.hello_int
-	return net
+		print "*** OSPF Network: %s" % network.prefix(), str(network.intfs) + ",", "cost %s," % network.cost, "hello interval %s," % network.hello_int
+	return compile_plan(net)
 
 def erdos_renyi_from_nx(n, p):
 	g = nx.erdos_renyi_graph(n,p)
@@ -567,7 +731,7 @@ def erdos_renyi_from_nx(n, p):
 	global TUNNEL_SETUP
 	"Create An Erdos Reny Topo"
 	"Creating OSHI"
-	net = Mininet( controller=RemoteController, switch=OVSKernelSwitch, host=OSHI, build=False )
+	net = PlanNet()
 	i = 0
 	h = 0
 	# This is the basic behavior, with nx we create only the core network
@@ -581,22 +745,17 @@ def erdos_renyi_from_nx(n, p):
 		lhs = net.getNodeByName('osh%s' % n1)
 		rhs = net.getNodeByName('osh%s' % n2)
 		l = net.addLink(lhs, rhs)
-		nets.append(OSPFNetwork(intfs=[l.intf1.name,l.intf2.name], ctrl=False))
+		nets.append(OSPFNetwork(intfs=[l.intf1.name,l.intf2.name], ctrl=False, p2p=True))
 		print "*** Connect", lhs, "To", rhs 
 
-	hosts_in_rn = []
-	c1 = RemoteController( 'c1', ip=ctrls_ip[0], port=ctrls_port[0])
+	c1 = net.addController('c1', ip=ctrls_ip[0], port=ctrls_port[0])
 	ctrls.append(c1)
-	hosts_in_rn.append(c1)
 
 	# Connecting the controller to the network 
 	print "*** Connect %s" % oshi," To c1"
 	l = net.addLink(oshi, c1)
 	nets.append(OSPFNetwork(intfs=[l.intf1.name,l.intf2.name], ctrl=True, hello_int=5))
-	
-	# Only needed for hosts in root namespace
-	fixIntf(hosts_in_rn)
-	
+
 	# Utility function
 	create_access_network(net)
 
@@ -615,7 +774,7 @@ def erdos_renyi_from_nx(n, p):
 
 	i = 0
 	for tunnel in tunnels :	
-		print "*** Tunnel %d, Subnet %s.%s.%s.%s, Intfs %s" % (i+1, tunnel.subnet[0], tunnel.subnet[1], tunnel.subnet[2], 0, tunnel.intfs)
+		print "*** Tunnel %d, Subnet %s, Intfs %s" % (i+1, tunnel.prefix(), tunnel.intfs)
 		i = i + 1
 
 	i = 0
@@ -636,14 +795,14 @@ def erdos_renyi_from_nx(n, p):
 
 
 	for network in nets:
-		print "*** OSPF Network: %s.%s.%s.%s" % (network.subnet[0], network.subnet[1], network.subnet[2], 0), str(network.intfs) + ",", "cost %s," % network.cost, "hello interval %s," % network.hello_int
+		print "*** OSPF Network: %s" % network.prefix(), str(network.intfs) + ",", "cost %s," % network.cost, "hello interval %s," % network.hello_int
 
 	# We generate the topo's png
 	pos = nx.circular_layout(g)
         nx.draw(g, pos)
         plt.savefig("topo.png")
 
-	return net
+	return compile_plan(net)
 
 def buildTopoFromNx(topo, args):
 	if topo == 'e_r':
@@ -666,101 +825,144 @@ def buildTopoFromNx(topo, args):
 	print "Error NX Wrong Parameter"
 	sys.exit(-2) 		
 
-def configure_env_oshi(oshi):
+# Provides the next controller (ip, port) in round robin
+def next_controller():
 	global next_ctrl
-	print "*** Configuring Environment For", oshi.name
-	shutil.rmtree("/tmp/" + oshi.name, ignore_errors=True)
-	os.mkdir("/tmp/" + oshi.name)
-	ctrl_ip = ctrls_ip[next_ctrl]
-	ctrl_port = ctrls_port[next_ctrl]
+	ctrl = (ctrls_ip[next_ctrl], ctrls_port[next_ctrl])
 	next_ctrl = (next_ctrl + 1) % len(ctrls_ip)
-	configure_ovs(oshi, ctrl_ip, ctrl_port)
-	configure_quagga(oshi)
-	oshi.cmd("echo 1 > /proc/sys/net/ipv4/ip_forward ")
-	oshi.cmd("echo 0 > /proc/sys/net/ipv4/conf/all/rp_filter") 
+	return ctrl
+
+# Allocates the addresses of the node's OSPF interfaces and of its loopback,
+# following node_index. It is kept out of the configuration functions, so the
+# addresses do not depend on the order in which the nodes are configured
+def allocate_addresses(node):
+	addresses = []
+	for (net, intf, tunnel) in node_index.get(node.name, []):
+		addresses.append((net, intf, net.give_me_next_ip()))
+	if node.kind == 'ctrl':
+		lo = give_me_loopbacks([node.name])[0]
+	else:
+		lo = node.loopback
+	return (addresses, lo)
+
+def compile_env_oshi(oshi, ctrl_ip, ctrl_port, addresses):
+	print "*** Configuring Environment For", oshi.name
+	config = new_config("/tmp/" + oshi.name)
+	config['update'] = new_update()
+	compile_ovs(oshi, ctrl_ip, ctrl_port, config)
+	compile_quagga(oshi, addresses, config)
+	params = [("net/ipv4/ip_forward", 1), ("net/ipv4/conf/all/rp_filter", 0)]
 	for intf in oshi.nameToIntf:
-		cmd = "echo 0 > /proc/sys/net/ipv4/conf/" + intf + "/rp_filter"
-		oshi.cmd(cmd)
+		params.append(("net/ipv4/conf/" + intf + "/rp_filter", 0))
 		intf = "vi%s" % (strip_number(intf))
 		if CORE_APPROACH == 'A':
 			VLAN_IP = 1 
 			intf = intf + "." + str(VLAN_IP)	
-		cmd = "echo 0 > /proc/sys/net/ipv4/conf/" + intf + "/rp_filter"
-		oshi.cmd(cmd)
-
-def configure_env_ctrl(ctrl):
-	global next_ctrl
+		params.append(("net/ipv4/conf/" + intf + "/rp_filter", 0))
+	compile_sysctl(config, params, config['workdir'] + "/sysctl.conf")
+	config['update']['sysctl'] = config['workdir'] + "/sysctl.conf"
+	config['start'] = compile_strip_ip(oshi) + compile_start_quagga(oshi)
+	config['stop'] = compile_stop_quagga(oshi) + config['stop'] + compile_stop_ovs(oshi)
+	return config
+
+def compile_env_ctrl(ctrl, addresses):
 	print "*** Configuring Environment For Controller", ctrl.name
-	shutil.rmtree("/tmp/" + ctrl.name, ignore_errors=True)
-	os.mkdir("/tmp/" + ctrl.name)
-	configure_quagga(ctrl)
-	ctrl.cmd("echo 1 > /proc/sys/net/ipv4/ip_forward ")
-	ctrl.cmd("echo 0 > /proc/sys/net/ipv4/conf/all/rp_filter") 
+	config = new_config("/tmp/" + ctrl.name)
+	config['update'] = new_update()
+	compile_quagga(ctrl, addresses, config)
+	params = [("net/ipv4/ip_forward", 1), ("net/ipv4/conf/all/rp_filter", 0)]
 	for intf in ctrl.nameToIntf:
-		cmd = "echo 0 > /proc/sys/net/ipv4/conf/" + intf + "/rp_filter"
-		ctrl.cmd(cmd)
-
-def configure_node(node):
+		params.append(("net/ipv4/conf/" + intf + "/rp_filter", 0))
+	compile_sysctl(config, params, config['workdir'] + "/sysctl.conf")
+	config['update']['sysctl'] = config['workdir'] + "/sysctl.conf"
+	config['start'] = compile_start_quagga(ctrl)
+	config['stop'] = compile_stop_quagga(ctrl) + config['stop']
+	return config
+
+def compile_node(node):
 	print "*** Configuring", node.name
-	strip_ip(node)
-	for net in nets:
-		intfs_to_conf = net.belong(node.name)
-		if(len(intfs_to_conf) > 0):
-			for intf_to_conf in intfs_to_conf:
-				sdn = False
-				for tunnel in tunnels:
-					if tunnel.belong(intf_to_conf) != None:
-						sdn = True
-						break
-				if sdn == False:
-					ip = net.give_me_next_ip()
-					gw_ip = "%s.%s.%s.%s" % (net.subnet[0], net.subnet[1], net.subnet[2], 1)
-					intf = intf_to_conf
-					node.cmd('ip addr add %s/%s brd + dev %s' %(ip, ip_netbit, intf))
-					node.cmd('ip link set %s up' % intf)
-					node.cmd('route add default gw %s %s' %(gw_ip, intf))
-				else:
-					ip = tunnel.give_me_next_ip()
-					intf = intf_to_conf
-					node.cmd('ip addr add %s/%s brd + dev %s' %(ip, sdn_netbit, intf))
-					node.cmd('ip link set %s up' % intf)
-
-def configure_ovs(oshi, ctrl_ip, ctrl_port):
+	config = new_config()
+	config_section(config, "host")
+	config['commands'].extend(compile_strip_ip(node))
+	for (net, intf, tunnel) in node_index.get(node.name, []):
+		if tunnel == None:
+			ip = net.give_me_next_ip()
+			gw_ip = net.gateway()
+			config['commands'].append('ip addr add %s/%s brd + dev %s' %(ip, net.netbit, intf))
+			config['commands'].append('ip link set %s up' % intf)
+			config['commands'].append('route add default gw %s %s' %(gw_ip, intf))
+			config['stop'].append('ip addr flush dev %s' % intf)
+		else:
+			ip = tunnel.give_me_next_ip()
+			config['commands'].append('ip addr add %s/%s brd + dev %s' %(ip, tunnel.netbit, intf))
+			config['commands'].append('ip link set %s up' % intf)
+			config['stop'].append('ip addr flush dev %s' % intf)
+	return config
+
+def compile_ovs(oshi, ctrl_ip, ctrl_port, config):
 	print "*** Configuring OVS For", oshi.name
-	path_ovs = "/tmp/" + oshi.name + "/ovs"
-	os.mkdir(path_ovs)
-	oshi.cmd("ovsdb-tool create " + path_ovs + "/conf.db")
-	oshi.cmd("ovsdb-server " + path_ovs + "/conf.db --remote=punix:" + path_ovs + "/db.sock --remote=db:Open_vSwitch,manager_options" +
-	" --no-chdir --unixctl=" + path_ovs + "/ovsdb-server.sock --detach")
-	oshi.cmd("ovs-vsctl --db=unix:" + path_ovs + "/db.sock --no-wait init")
-	oshi.cmd("ovs-vswitchd unix:" + path_ovs + "/db.sock -vinfo --log-file=" + path_ovs + "/ovs-vswitchd.log --no-chdir --detach")
-	oshi.cmd("ovs-vsctl --db=unix:" + path_ovs + "/db.sock --no-wait add-br br-" + oshi.name)
+	path_ovs = config['workdir'] + "/ovs"
+	config['dirs'].append(path_ovs)
+	config_section(config, "ovs")
+	config['commands'].append("ovsdb-tool create " + path_ovs + "/conf.db")
+	config['commands'].append("ovsdb-server " + path_ovs + "/conf.db --remote=punix:" + path_ovs + "/db.sock --remote=db:Open_vSwitch,manager_options" +
+	" --no-chdir --unixctl=" + path_ovs + "/ovsdb-server.sock --pidfile=" + path_ovs + "/ovsdb-server.pid --detach")
+	config['commands'].append("ovs-vswitchd unix:" + path_ovs + "/db.sock -vinfo --log-file=" + path_ovs + "/ovs-vswitchd.log --no-chdir" +
+	" --pidfile=" + path_ovs + "/ovs-vswitchd.pid --detach")
+	config['pidfiles'].append(("ovsdb-server", path_ovs + "/ovsdb-server.pid"))
+	config['pidfiles'].append(("ovs-vswitchd", path_ovs + "/ovs-vswitchd.pid"))
+
+	# The bridge is defined by a few ovs-vsctl invocations, the commands are chained
+	# with "--" and committed in OVSDB transactions bounded by MAX_BATCH_LENGTH (see
+	# ovs_vsctl_lines). A port and its number (ofport_request) are in the same
+	# transaction, the numbers do not depend on the order the ports are created:
+	# they are derived from the interface (eth<n> is 2n+1, vi<n> is 2n+2), so the
+	# other ports keep their numbers (and rules) when an interface is removed
+	bridge = "br-" + oshi.name
+	transaction = ["init", "add-br " + bridge]
+	groups = [transaction]
 
 	# Talking with controller
-	oshi.cmd("ovs-vsctl --db=unix:" + path_ovs + "/db.sock --no-wait set-fail-mode br-" + oshi.name + " secure")
-	oshi.cmd("ovs-vsctl --db=unix:" + path_ovs + "/db.sock --no-wait set-controller br-" + oshi.name + " tcp:%s:%s" %(ctrl_ip, ctrl_port)) 
-	oshi.cmd("ovs-vsctl --db=unix:" + path_ovs + "/db.sock --no-wait set controller br-" + oshi.name + " connection-mode=out-of-band")
+	transaction.append("set-fail-mode " + bridge + " secure")
+	transaction.append("set-controller " + bridge + " tcp:%s:%s" %(ctrl_ip, ctrl_port))
+	transaction.append("set controller " + bridge + " connection-mode=out-of-band")
 
-	# Setting DPID	
-	oshi.cmd("ovs-vsctl --db=unix:" + path_ovs + "/db.sock --no-wait -- set Bridge br-" + oshi.name + " other_config:datapath-id=" + oshi.dpid )
+	# Setting DPID
+	transaction.append("set Bridge " + bridge + " other_config:datapath-id=" + loopbackDpid(oshi.loopback, "00000000"))
+	# The bundles need OpenFlow 1.4, the controller can still use OpenFlow 1.0
+	if flows_mode == 'bundle':
+		transaction.append("set Bridge " + bridge + " protocols=OpenFlow10,OpenFlow14")
 
 	eth_ports = []
 	vi_ports = []
-	n_ports = 1
 	for intf in oshi.nameToIntf:
-		if 'lo' not in intf:		
-			oshi.cmd("ovs-vsctl --db=unix:" + path_ovs + "/db.sock --no-wait add-port br-" + oshi.name + " " + intf)
+		if 'lo' not in intf:
+			n_ports = 2 * strip_number(intf) + 1
+			group = []
+			group.append("add-port " + bridge + " " + intf)
+			group.append("set Interface " + intf + " ofport_request=%s" % n_ports)
+			oshi.ofports[intf] = n_ports
 			eth_ports.append(n_ports)
 			n_ports = n_ports + 1
 			viname = "vi%s" % strip_number(intf)
-			oshi.cmd("ovs-vsctl --db=unix:" + path_ovs + "/db.sock --no-wait add-port br-" + oshi.name + " " + viname
-			+ " -- set Interface " + viname + " type=internal")
+			group.append("add-port " + bridge + " " + viname)
+			group.append("set Interface " + viname + " type=internal ofport_request=%s" % n_ports)
+			groups.append(group)
+			oshi.ofports[viname] = n_ports
 			vi_ports.append(n_ports)
-			n_ports = n_ports + 1
+			intf_config(config, intf)['ports'] = [intf, viname]
+			intf_config(config, intf)['ovs'] = group
+	# ovs-vsctl waits until ovs-vswitchd has created the ports, the next commands use them
+	ovsdb = "ovs-vsctl --db=unix:" + path_ovs + "/db.sock --timeout=30 "
+	config['commands'].extend(ovs_vsctl_lines(ovsdb, groups))
+	config['update']['base'] = list(transaction)
+	config['update']['ovsdb'] = ovsdb
+	# The rules of the bridge are collected and installed at the end with a single call
+	flows = []
 	if CORE_APPROACH == 'A':
-		conf_flows_vlan_approach(oshi, eth_ports, vi_ports)
+		conf_flows_vlan_approach(oshi, eth_ports, vi_ports, flows)
 	elif CORE_APPROACH =='B':
-		conf_flow_no_vlan_approach(oshi, eth_ports, vi_ports)
+		conf_flow_no_vlan_approach(oshi, eth_ports, vi_ports, flows)
 
 	if 'aos' in oshi.name:
 		for i in range(0, len(L2nets)):
@@ -771,252 +973,478 @@ def configure_ovs(oshi, ctrl_ip, ctrl_port):
 			if len(intfs) == 1 :
 				print "*** Configuring Ingress/Egress Rules For %s In Network %s" % (oshi, L2nets[i].name)
 				if L2nets[i].classification == 'A':
-					conf_flows_ingress_egress_vlan_approach(oshi, i, intfs[0])
+					conf_flows_ingress_egress_vlan_approach(oshi, i, intfs[0], flows)
 				elif L2nets[i].classification == 'B':
-					conf_flows_ingress_egress_no_vlan_approach(oshi, i, intfs[0])
+					conf_flows_ingress_egress_no_vlan_approach(oshi, i, intfs[0], flows)
+	compile_flows(config, bridge, flows, path_ovs + "/flows.txt", flows_mode)
+	config['update']['flows'] = [bridge, path_ovs + "/flows.txt", flows_mode]
 
-def conf_flows_ingress_egress_vlan_approach(oshi, i, intf):
+def conf_flows_ingress_egress_vlan_approach(oshi, i, intf, flows):
 	if CORE_APPROACH == 'A':
 		print "*** Already Done Same Approach Between Core And Access"
 	elif CORE_APPROACH == 'B':
 		print "*** Add Rules For Vlan Access Approach"
 		VLAN_IP = L2nets[i].VlanIP	
 		eth_intf = intf
-		eth_port_number = convert_port_name_to_number(oshi, eth_intf)
+		eth_port_number = oshi.ofport(eth_intf)
 		vi_intf = "vi%s" % strip_number(eth_intf)
-		vi_port_number = convert_port_name_to_number(oshi, vi_intf)
-		oshi.cmd("ovs-ofctl add-flow br-%s \"table=0,hard_timeout=0,priority=300,in_port=%s,dl_vlan=%s,actions=strip_vlan,resubmit(,1)\"" % (oshi.name, eth_port_number,VLAN_IP))
-		oshi.cmd("ovs-ofctl add-flow br-%s \"table=1,hard_timeout=0,priority=300,in_port=%s,actions=mod_vlan_vid:%s,output:%s\"" % (oshi.name,vi_port_number,VLAN_IP,eth_port_number))
+		vi_port_number = oshi.ofport(vi_intf)
+		flows.append("table=0,hard_timeout=0,priority=300,in_port=%s,dl_vlan=%s,actions=strip_vlan,resubmit(,1)" % (eth_port_number,VLAN_IP))
+		flows.append("table=1,hard_timeout=0,priority=300,in_port=%s,actions=mod_vlan_vid:%s,output:%s" % (vi_port_number,VLAN_IP,eth_port_number))
 
-def conf_flows_ingress_egress_no_vlan_approach(oshi, i, intf):
+def conf_flows_ingress_egress_no_vlan_approach(oshi, i, intf, flows):
 	if CORE_APPROACH == 'B':
 		print "*** Already Done Same Approach Between Core And Access"
 	elif CORE_APPROACH == 'A':
 		print "*** Add Rule For No Vlan Access Approach"
 		VLAN_IP = 1 # Core Vlan	
 		eth_intf = intf
-		eth_port_number = convert_port_name_to_number(oshi, eth_intf)
+		eth_port_number = oshi.ofport(eth_intf)
 		vi_intf = "vi%s" % strip_number(eth_intf)
-		vi_port_number = convert_port_name_to_number(oshi, vi_intf)
-		oshi.cmd("ovs-ofctl del-flows br-%s in_port=%s,dl_vlan=%s" % (oshi.name,eth_port_number,VLAN_IP))
-		oshi.cmd("ovs-ofctl add-flow br-%s hard_timeout=0,priority=300,in_port=%s,dl_vlan=%s,actions=mod_vlan_vid:%s,output:%s" % (oshi.name,eth_port_number,"0xffff",VLAN_IP,vi_port_number))
-		oshi.cmd("ovs-ofctl add-flow br-%s hard_timeout=0,priority=300,in_port=%s,dl_vlan=%s,actions=strip_vlan,output:%s" % (oshi.name,vi_port_number,VLAN_IP,eth_port_number)) 
+		vi_port_number = oshi.ofport(vi_intf)
+		# The core rule of the port is replaced before the installation, there is no
+		# window without a matching rule
+		del_flows(flows, "in_port=%s,dl_vlan=%s" % (eth_port_number,VLAN_IP))
+		flows.append("hard_timeout=0,priority=300,in_port=%s,dl_vlan=%s,actions=mod_vlan_vid:%s,output:%s" % (eth_port_number,"0xffff",VLAN_IP,vi_port_number))
+		flows.append("hard_timeout=0,priority=300,in_port=%s,dl_vlan=%s,actions=strip_vlan,output:%s" % (vi_port_number,VLAN_IP,eth_port_number))
 			
-def conf_flows_vlan_approach(oshi, eth_ports, vi_ports):
+def conf_flows_vlan_approach(oshi, eth_ports, vi_ports, flows):
 	print "*** Configuring Flows Classifier A For", oshi
 	VLAN_IP = 1
 	size = len(eth_ports)
 	i = 0
 	for i in range(size):
-		oshi.cmd("ovs-ofctl add-flow br-" + oshi.name + " hard_timeout=0,priority=300,in_port=" + str(eth_ports[i])
+		flows.append("hard_timeout=0,priority=300,in_port=" + str(eth_ports[i])
 		+ ",dl_vlan=" + str(VLAN_IP) + ",action=output:" + str(vi_ports[i]))
-		oshi.cmd("ovs-ofctl add-flow br-" + oshi.name + " hard_timeout=0,priority=300,in_port=" + str(vi_ports[i])
+		flows.append("hard_timeout=0,priority=300,in_port=" + str(vi_ports[i])
 		+ ",dl_vlan=" + str(VLAN_IP) + ",action=output:" + str(eth_ports[i]))
-	oshi.cmd("ovs-ofctl add-flow br-" + oshi.name + " hard_timeout=0,priority=400,dl_type=0x88cc,action=controller")
-	oshi.cmd("ovs-ofctl add-flow br-" + oshi.name + " hard_timeout=0,priority=400,dl_type=0x8942,action=controller")
+	flows.append("hard_timeout=0,priority=400,dl_type=0x88cc,action=controller")
+	flows.append("hard_timeout=0,priority=400,dl_type=0x8942,action=controller")
 
-def conf_flow_no_vlan_approach(oshi, eth_ports, vi_ports):
+def conf_flow_no_vlan_approach(oshi, eth_ports, vi_ports, flows):
 	print "*** Configuring Flows Classifier B For", oshi	
 	size = len(eth_ports)
 	i = 0
-	oshi.cmd("ovs-ofctl add-flow br-" + oshi.name + " \"table=0,hard_timeout=0,priority=300,dl_vlan=0xffff,actions=resubmit(,1)\"")
+	flows.append("table=0,hard_timeout=0,priority=300,dl_vlan=0xffff,actions=resubmit(,1)")
 	for i in range(size):
-		oshi.cmd("ovs-ofctl add-flow br-" + oshi.name + " \"table=1,hard_timeout=0,priority=300,in_port=" + str(eth_ports[i])
-		+ ",action=output:" + str(vi_ports[i]) + "\"")
-		oshi.cmd("ovs-ofctl add-flow br-" + oshi.name + " \"table=1,hard_timeout=0,priority=300,in_port=" + str(vi_ports[i])
-		+ ",action=output:" + str(eth_ports[i]) + "\"")
-	oshi.cmd("ovs-ofctl add-flow br-" + oshi.name + " \"table=1,hard_timeout=0,priority=400,dl_type=0x88cc,action=controller\"")
-	oshi.cmd("ovs-ofctl add-flow br-" + oshi.name + " \"table=1,hard_timeout=0,priority=400,dl_type=0x8942,action=controller\"")
+		flows.append("table=1,hard_timeout=0,priority=300,in_port=" + str(eth_ports[i])
+		+ ",action=output:" + str(vi_ports[i]))
+		flows.append("table=1,hard_timeout=0,priority=300,in_port=" + str(vi_ports[i])
+		+ ",action=output:" + str(eth_ports[i]))
+	flows.append("table=1,hard_timeout=0,priority=400,dl_type=0x88cc,action=controller")
+	flows.append("table=1,hard_timeout=0,priority=400,dl_type=0x8942,action=controller")
 
 def clean_env(oshi):
 	print "*** Cleaning Environment For", oshi.name
-	shutil.rmtree("/tmp/" + oshi.name, ignore_errors=True)
+	remove_tree("/tmp/" + oshi.name)
 
-def configure_quagga(oshi):
+# Adds the Quagga configuration of the node to config, addresses is provided by allocate_addresses
+def compile_quagga(oshi, addresses, config):
 	print "*** Configuring Quagga For", oshi.name
-	path_quagga = "/tmp/" + oshi.name + "/quagga"
-	os.mkdir(path_quagga)
-	zebra_conf = open(path_quagga + "/zebra.conf","w")
-	ospfd_conf = open(path_quagga + "/ospfd.conf","w")
+	path_quagga = config['workdir'] + "/quagga"
+	config['dirs'].append(path_quagga)
+	config_section(config, "quagga")
+	# The pidfiles written by the daemons started by compile_start_quagga
+	config['pidfiles'].append(("zebra", path_quagga + "/zebra.pid"))
+	config['pidfiles'].append(("ospfd", path_quagga + "/ospfd.pid"))
+	zebra_conf = []
+	ospfd_conf = []
 	ospfd_nets = []
-	ospfd_conf.write("hostname %s\n" % oshi.name)
-	ospfd_conf.write("password zebra\n")
-	ospfd_conf.write("log file /var/log/quagga/ospfd.log\n\n")
-	zebra_conf.write("hostname %s\n" % oshi.name)
-	zebra_conf.write("password zebra\n")
-	zebra_conf.write("enable password zebra\n")
-	zebra_conf.write("log file /var/log/quagga/zebra.log\n\n")
-	for net in nets:
-		intfs_to_conf = net.belong(oshi.name)
-		if(len(intfs_to_conf) > 0):
-			ospfd_nets.append(("%s.%s.%s.%s" %(net.subnet[0], net.subnet[1], net.subnet[2], 0), ip_netbit,(net.area)))
-			for intf_to_conf in intfs_to_conf:
-				ip = net.give_me_next_ip()
-				if CORE_APPROACH == "A":
-					intfname = configure_ospf_vlan_approach(oshi, intf_to_conf)
-				elif CORE_APPROACH == "B":
-					intfname = configure_ospf_no_vlan_approach(oshi, intf_to_conf)
-				ospfd_conf.write("interface " + intfname + "\n")
-				ospfd_conf.write("ospf cost %s\n" % net.cost)
-				ospfd_conf.write("ospf hello-interval %s\n\n" % net.hello_int)
-				zebra_conf.write("interface " + intfname + "\n")
-				zebra_conf.write("ip address %s/%s\n" %(ip, ip_netbit))
-				zebra_conf.write("link-detect\n\n")
+	ospfd_conf.append("hostname %s\n" % oshi.name)
+	ospfd_conf.append("password zebra\n")
+	ospfd_conf.append("log file /var/log/quagga/ospfd.log\n\n")
+	zebra_conf.append("hostname %s\n" % oshi.name)
+	zebra_conf.append("password zebra\n")
+	zebra_conf.append("enable password zebra\n")
+	zebra_conf.append("log file /var/log/quagga/zebra.log\n\n")
+	last_net = None
+	(intf_addresses, lo) = addresses
+	for (net, intf_to_conf, ip) in intf_addresses:
+		# The entries of the same network are consecutive
+		if net is not last_net:
+			ospfd_nets.append(("%s.%s.%s.%s" %(net.subnet[0], net.subnet[1], net.subnet[2], net.subnet[3]), net.netbit,(net.area)))
+			last_net = net
+		if CORE_APPROACH == "A":
+			intfname = configure_ospf_vlan_approach(oshi, intf_to_conf, config)
+		elif CORE_APPROACH == "B":
+			intfname = configure_ospf_no_vlan_approach(oshi, intf_to_conf, config)
+		ospfd_conf.append("interface " + intfname + "\n")
+		ospfd_conf.append("ospf cost %s\n" % net.cost)
+		ospfd_conf.append("ospf hello-interval %s\n\n" % net.hello_int)
+		zebra_conf.append("interface " + intfname + "\n")
+		zebra_conf.append("ip address %s/%s\n" %(ip, net.netbit))
+		zebra_conf.append("link-detect\n\n")
 	intfname = 'lo'
-	if type(oshi) is RemoteController:
-		ip = give_me_next_loopback()
-	else:
-		ip = oshi.loopback
-	ospfd_conf.write("interface " + intfname + "\n")
-	ospfd_conf.write("ospf cost %s\n" % 1)
-	ospfd_conf.write("ospf hello-interval %s\n\n" % 2)
-	zebra_conf.write("interface " + intfname + "\n")
-	zebra_conf.write("ip address %s/%s\n" %(ip, 32))
-	zebra_conf.write("link-detect\n\n")
-	ospfd_conf.write("router ospf\n")
+	ip = lo
+	ospfd_conf.append("interface " + intfname + "\n")
+	ospfd_conf.append("ospf cost %s\n" % 1)
+	ospfd_conf.append("ospf hello-interval %s\n\n" % 2)
+	zebra_conf.append("interface " + intfname + "\n")
+	zebra_conf.append("ip address %s/%s\n" %(ip, 32))
+	zebra_conf.append("link-detect\n\n")
+	ospfd_conf.append("router ospf\n")
 	ospfd_nets.append((ip, 32, "0.0.0.0"))
 	for ospfd_net in ospfd_nets:	
-		ospfd_conf.write("network %s/%s area %s\n" %(ospfd_net[0], ospfd_net[1] , ospfd_net[2]))
-	ospfd_conf.close()
-	zebra_conf.close()
-	oshi.cmd("chmod -R 777 /var/log/quagga")
-	oshi.cmd("chmod -R 777 /var/run/quagga")	
-	oshi.cmd("chmod -R 777 %s" %(path_quagga))
-
-def configure_ospf_vlan_approach(oshi, intfname):
+		ospfd_conf.append("network %s/%s area %s\n" %(ospfd_net[0], ospfd_net[1] , ospfd_net[2]))
+	config['files'].append((path_quagga + "/zebra.conf", "".join(zebra_conf)))
+	config['files'].append((path_quagga + "/ospfd.conf", "".join(ospfd_conf)))
+	config['commands'].append("chmod -R 777 /var/log/quagga")
+	config['commands'].append("chmod -R 777 /var/run/quagga")	
+	config['commands'].append("chmod -R 777 %s" %(path_quagga))
+	config['update']['quagga'] = path_quagga
+
+# Provides the commands that start the Quagga daemons of the node, their pid
+# files are in the configuration directory
+def compile_start_quagga(node):
+	path_quagga_conf = "/tmp/" + node.name + "/quagga"
+	return ["%szebra -f %s/zebra.conf -i %s/zebra.pid -A 127.0.0.1 &" %(path_quagga_exec, path_quagga_conf, path_quagga_conf),
+		"%sospfd -f %s/ospfd.conf -i %s/ospfd.pid -A 127.0.0.1 &" %(path_quagga_exec, path_quagga_conf, path_quagga_conf)]
+
+# Provides the commands that stop the Quagga daemons of the node
+def compile_stop_quagga(node):
+	path_quagga_conf = "/tmp/" + node.name + "/quagga"
+	return ["kill $(cat %s/zebra.pid %s/ospfd.pid 2>/dev/null) 2>/dev/null" %(path_quagga_conf, path_quagga_conf)]
+
+# Provides the commands that remove the bridge of the OSHI (and its internal
+# ports) and stop its OVS daemons
+def compile_stop_ovs(oshi):
+	path_ovs = "/tmp/" + oshi.name + "/ovs"
+	return ["ovs-vsctl --db=unix:" + path_ovs + "/db.sock --timeout=5 --if-exists del-br br-" + oshi.name,
+		"kill $(cat %s/ovs-vswitchd.pid %s/ovsdb-server.pid 2>/dev/null) 2>/dev/null" %(path_ovs, path_ovs)]
+
+def configure_ospf_vlan_approach(oshi, intfname, config):
 	VLAN_IP = 1
+	intf_to_conf = intfname
 	if 'c1' not in oshi.name:
 		intfname = "vi%s" % (strip_number(intfname))
-	oshi.cmd('ip link set %s up' % intfname)
-	oshi.cmd('modprobe 8021q')
-	oshi.cmd('vconfig add %s %s' % (intfname, VLAN_IP))
+	commands = ['ip link set %s up' % intfname, 'vconfig add %s %s' % (intfname, VLAN_IP)]
 	intfname = intfname + "." + str(VLAN_IP)
+	stop = ['ip link del %s' % intfname]
+	config['commands'].extend(commands)
+	config['stop'].extend(stop)
+	intf_config(config, intf_to_conf)['commands'].extend(commands)
+	intf_config(config, intf_to_conf)['stop'].extend(stop)
 	return intfname
 
-def configure_ospf_no_vlan_approach(oshi, intfname):
+def configure_ospf_no_vlan_approach(oshi, intfname, config):
+	intf_to_conf = intfname
 	if 'c1' not in oshi.name:
 		intfname = "vi%s" % (strip_number(intfname))
-	oshi.cmd('ip link set %s up' % intfname)
+	config['commands'].append('ip link set %s up' % intfname)
+	intf_config(config, intf_to_conf)['commands'].append('ip link set %s up' % intfname)
 	return intfname
 
-def configure_vll_pusher(net):
+# Provides the lines of the Vll Pusher configuration file
+def compile_vll_pusher(net):
 	print "*** Create Configuration File For Vll Pusher"
-	path = vll_path + "vll_pusher.cfg"
-	vll_pusher_cfg = open(path,"w")
+	lines = []
 	for i in range(0, len(LHS_tunnel_aoshi)):
 		aoshi = LHS_tunnel_aoshi[i]		
-		lhs_dpid = net.getNodeByName(aoshi).dpid
+		lhs_dpid = loopbackDpid(net.getNodeByName(aoshi).loopback, "00000000")
 		lhs_dpid = ':'.join(s.encode('hex') for s in lhs_dpid.decode('hex'))
 		port = LHS_tunnel_port[i]
 		lhs_port = port
 		aoshi = RHS_tunnel_aoshi[i]		
-		rhs_dpid = net.getNodeByName(aoshi).dpid
+		rhs_dpid = loopbackDpid(net.getNodeByName(aoshi).loopback, "00000000")
 		rhs_dpid = ':'.join(s.encode('hex') for s in rhs_dpid.decode('hex'))
 		port = RHS_tunnel_port[i]
 		rhs_port = port
-		vll_pusher_cfg.write("%s|%s|%s|%s|%d|%d|\n" % (lhs_dpid, rhs_dpid, lhs_port, rhs_port, LHS_tunnel_vlan[i], RHS_tunnel_vlan[i]))
+		lines.append("%s|%s|%s|%s|%d|%d|\n" % (lhs_dpid, rhs_dpid, lhs_port, rhs_port, LHS_tunnel_vlan[i], RHS_tunnel_vlan[i]))
+	return lines
+
+# Writes the Vll Pusher configuration file of the plan
+def configure_vll_pusher(plan):
+	path = vll_path + "vll_pusher.cfg"
+	vll_pusher_cfg = open(path,"w")
+	for line in plan['vll_pusher']:
+		vll_pusher_cfg.write(line)
 	vll_pusher_cfg.close()
-	root = Node( 'root', inNamespace=False )
+	root = get_root()
 	root.cmd("chmod 777 %s" %(path))
-	
-def init_net(net):
+		
+# Blocks until every router has the expected OSPF adjacencies (derived from nets)
+# and the routes towards the loopbacks of the other routers, or the timeout expires
+def wait_ospf_convergence(loopbacks):
+	print "*** Waiting For The OSPF Convergence"
+	routers = oshis + aoshis + ctrls
+	expected = expected_neighbors(nets, [router.name for router in routers])
+	def converged(router):
+		return ospf_converged(router, expected[router.name], loopbacks)
+	times = poll_nodes(routers, converged, convergence_timeout)
+	print_poll_report("OSPF Converged", times)
+	return times
+
+# Applies a topology file to the running network. The plan is compiled with the
+# loopbacks, the point to point networks and the ports of the running one, so
+# the unchanged part of the topology keeps its addresses and interface names;
+# then only the differences (see plan_diff) are applied, the other nodes and
+# their OSPF adjacencies keep running. The changed routers are changed in place
+# (see compile_update), a router is stopped and configured again only if its
+# bridge or the global lines of its Quagga configuration changed
+def redeploy(net, param):
+	global running_plan
+	global live_nodes
+	global pinned_links
+	old = running_plan
+	print "*** Redeploy Topology From File:", param
+	reset_topology()
+	configure_ipam()
+	loopbacks = dict(old['hosts'])
+	loopbacks.update(old['loopbacks'])
+	pin_addresses(loopbacks, old['nets'])
+	pinned_links = old['links']
+	try:
+		with phase("build"):
+			plan = buildTopoFromFile(param)
+	except SystemExit:
+		# The running network is left as it is
+		reset_topology()
+		bind_plan(old, live_nodes)
+		raise
+	finally:
+		pinned_links = []
+		pin_addresses({}, [])
+	diff = plan_diff(old, plan)
+	print "*** Redeploy: %s Nodes Removed, %s Added, %s Changed - %s Links Removed, %s Added" % (len(diff['removed_nodes']),
+		len(diff['added_nodes']), len(diff['changed_nodes']), len(diff['removed_links']), len(diff['added_links']))
+	old_params = plan_nodes(old)
+	params = plan_nodes(plan)
+	nodes = dict(live_nodes)
+	updates = {}
+	for name in diff['changed_nodes']:
+		if name in old['configs']:
+			update = compile_update(old['configs'][name], plan['configs'][name])
+			if update != None:
+				updates[name] = update
+	touched = diff['added_nodes'] + [name for name in diff['changed_nodes'] if name not in updates]
+	print "*** Redeploy: %s Nodes Changed In Place" % len(updates)
+	with phase("redeploy"):
+		# The removed and the changed nodes are stopped, the ones changed in place
+		# only lose the removed interfaces
+		tasks = []
+		for name in diff['removed_nodes'] + diff['changed_nodes']:
+			if name in updates:
+				tasks.append((run_commands, (nodes[name], updates[name][0])))
+			elif name in old['configs']:
+				tasks.append((run_commands, (nodes[name], old['configs'][name]['stop'])))
+		run_tasks(tasks, config_workers)
+		for (lhs, rhs, port1, port2) in diff['removed_links']:
+			print "*** Disconnect", lhs, "From", rhs
+			link = nodes[lhs].nameToIntf["%s-eth%s" % (lhs, port1)].link
+			for (name, intf) in ((lhs, link.intf1), (rhs, link.intf2)):
+				if old_params[name][0] == 'switch':
+					nodes[name].detach(intf)
+			net.delLink(link)
+		for name in diff['removed_nodes']:
+			print "*** Remove", name
+			node = nodes.pop(name)
+			if name in net.nameToNode:
+				net.delNode(node)
+			else:
+				node.stop()
+			if isinstance(node, OSHI):
+				node.unmountBindMounts()
+			clean_env(node)
+		for name in diff['added_nodes']:
+			print "*** Add", name
+			nodes[name] = add_node(net, name, params[name])
+		root_nodes = []
+		for (lhs, rhs, port1, port2) in diff['added_links']:
+			print "*** Connect", lhs, "To", rhs
+			link = add_link(net, nodes[lhs], nodes[rhs], port1, port2)
+			for (name, intf) in ((lhs, link.intf1), (rhs, link.intf2)):
+				if params[name][0] != 'host':
+					root_nodes.append(nodes[name])
+				if params[name][0] == 'switch' and name not in diff['added_nodes']:
+					nodes[name].attach(intf)
+		for name in diff['added_nodes']:
+			if params[name][0] == 'switch':
+				nodes[name].start(net.controllers)
+		# Only needed for hosts in root namespace
+		fixIntf(list(set(root_nodes)))
+
+		tasks = []
+		for name in touched:
+			tasks.append((apply_config, (nodes[name], plan['configs'][name])))
+		for name in sorted(updates):
+			tasks.append((apply_update, (nodes[name], plan['configs'][name], updates[name][1])))
+		run_tasks(tasks, config_workers)
+		routers = []
+		for name in plan['oshis'] + plan['aoshis'] + [ctrl[0] for ctrl in plan['ctrls']]:
+			if name in touched:
+				routers.append(nodes[name])
+		run_tasks([(run_commands, (router, plan['configs'][router.name]['start'])) for router in routers], config_workers)
+		record_pids([(name, plan['configs'][name]) for name in touched])
+		if diff['root']:
+			ovs_vsctl_batch(plan['root'])
+		if diff['vll_pusher']:
+			configure_vll_pusher(plan)
+	reset_topology()
+	bind_plan(plan, nodes)
+	live_nodes = nodes
+	running_plan = plan
+	if convergence_timeout > 0 and len(routers) + len(updates) > 0:
+		if len(routers) > 0:
+			print "*** Waiting For The Quagga Daemons"
+			print_poll_report("Quagga Ready", poll_nodes(routers, quagga_ready, convergence_timeout))
+		with phase("convergence"):
+			wait_ospf_convergence(plan['loopbacks'])
+	return diff
+
+# Mininet CLI of the deployer, with the redeploy command
+class DeployerCLI(CLI):
+
+	def do_redeploy(self, line):
+		"""Apply the changes of a topology file to the running network
+		   Usage: redeploy file:topo.json"""
+		data = line.strip().split(":")
+		if len(data) != 2 or data[0] != 'file':
+			print "Error Usage: redeploy file:topo.json"
+			return
+		try:
+			redeploy(self.mn, data[1])
+		except SystemExit:
+			print "Error Redeploy Of", data[1], "Failed"
+
+# Applies the plan to the network built by buildTopoFromPlan: the
+# configurations of the nodes are applied by at most config_workers workers,
+# each of them runs the commands of a node in its namespace
+def init_net(net, plan):
 	"Init Function"
-	root = Node( 'root', inNamespace=False )
-	root.cmd('stop avahi-daemon')
-	root.cmd('killall dhclient')
-	root.cmd('killall zebra')
-	root.cmd('killall ospfd')
-	fixEnvironment()
-	print "*** Restarting Network Manager"
-	time.sleep(10)
-	root.cmd('service network-manager restart')
-	time.sleep(2)	
-	net.start()
-
-	# Configure the ctrl
-	for ctrl in ctrls:
-		configure_env_ctrl(ctrl)
-	for oshi in oshis:
-		configure_env_oshi(oshi)
-	for oshi in oshis:
-		strip_ip(oshi)
-		path_quagga_conf = "/tmp/" + oshi.name + "/quagga"
-		oshi.cmd("%szebra -f %s/zebra.conf -A 127.0.0.1 &" %(path_quagga_exec, path_quagga_conf))
-		oshi.cmd("%sospfd -f %s/ospfd.conf -A 127.0.0.1 &" %(path_quagga_exec, path_quagga_conf))
-	for aoshi in aoshis:
-		configure_env_oshi(aoshi)
-	for aoshi in aoshis:
-		strip_ip(aoshi)
-		path_quagga_conf = "/tmp/" + aoshi.name + "/quagga"
-		aoshi.cmd("%szebra -f %s/zebra.conf -A 127.0.0.1 &" %(path_quagga_exec, path_quagga_conf))
-		aoshi.cmd("%sospfd -f %s/ospfd.conf -A 127.0.0.1 &" %(path_quagga_exec, path_quagga_conf))
-	for ctrl in ctrls:	
-		path_quagga_conf = "/tmp/" + ctrl.name + "/quagga"
-		ctrl.cmd("%szebra -f %s/zebra.conf -A 127.0.0.1 &" %(path_quagga_exec, path_quagga_conf))
-		ctrl.cmd("%sospfd -f %s/ospfd.conf -A 127.0.0.1 &" %(path_quagga_exec, path_quagga_conf))
-	print "*** Configuring Hosts"
-	i = 0
-	for i in range(len(hosts)):
-		host = net.getNodeByName(hosts[i])
-		configure_node(host)
-	configure_standalone_sw(switches)
-	configure_l2_accessnetwork()
-	# Configure VLL Pusher
-	configure_vll_pusher(net)
+	global running_plan
+	root = get_root()
+	with phase("init"):
+		root.cmd('stop avahi-daemon')
+		root.cmd('killall dhclient')
+		wait_for("dhclient Exit", partial(processes_gone, root, ['dhclient']))
+		fixEnvironment()
+		print "*** Restarting Network Manager"
+		root.cmd('service network-manager restart')
+		wait_for("Network Manager", partial(network_manager_active, root))
+		wait_for("Open vSwitch", partial(ovs_ready, root))
+	with phase("net_start"):
+		net.start()
+	# net.start() adds the default controller c0, the controllers of the plan
+	# are not in net: its shell is recorded to be released by the teardown
+	for controller in net.controllers:
+		record('node', name=controller.name, pid=getattr(controller, 'pid', None))
+
+	# The vlan interfaces of the OSHI need the 8021q module, it is loaded once
+	if CORE_APPROACH == 'A':
+		root.cmd('modprobe 8021q')
+
+	tasks = []
+	for node in ctrls + oshis + aoshis:
+		tasks.append((apply_config, (node, plan['configs'][node.name])))
+	for host in hosts:
+		tasks.append((apply_config, (net.getNodeByName(host), plan['configs'][host])))
+	with phase("configure"):
+		print "*** Applying The Configuration Of %s Nodes" % len(tasks)
+		run_tasks(tasks, config_workers)
+	tasks = []
+	for node in oshis + aoshis + ctrls:
+		tasks.append((run_commands, (node, plan['configs'][node.name]['start'])))
+	with phase("quagga_start"):
+		run_tasks(tasks, config_workers)
+		if convergence_timeout > 0:
+			print "*** Waiting For The Quagga Daemons"
+			print_poll_report("Quagga Ready", poll_nodes(oshis + aoshis + ctrls, quagga_ready, convergence_timeout))
+		record_pids(plan['configs'].items())
+	with phase("root"):
+		print "*** Configuring L2 Switches And Access Networks"
+		ovs_vsctl_batch(plan['root'])
+		# Configure VLL Pusher
+		configure_vll_pusher(plan)
+		record('file', path=vll_path + "vlls.json")
+	if convergence_timeout > 0:
+		with phase("convergence"):
+			wait_ospf_convergence(plan['loopbacks'])
+	# The CLI can redeploy on top of the running plan
+	running_plan = plan
 	print "*** Type 'exit' or control-D to shut down network"
-	CLI( net )
-	net.stop()
-	subprocess.call(["sudo", "mn", "-c"], stdout=None, stderr=None)
-	for oshi in oshis:
-		clean_env(oshi)	
-	for aoshi in aoshis:
-		clean_env(aoshi)	
-	for ctrl in ctrls:
-		clean_env(ctrl)
-	path = vll_path + "vlls.json"
-	if(os.path.exists(path)):
-		print "*** Remove Vlls DB File"
-		os.remove(path)
-	print '*** Unmounting host bind mounts'
-	root.cmd('service network-manager restart')
-	root.cmd('start avahi-daemon') 
-	root.cmd('killall ovsdb-server')
-	root.cmd('killall ovs-vswitchd')
-	root.cmd('killall zebra')
-	root.cmd('killall ospfd')
-	root.cmd('/etc/init.d/openvswitch-switch restart') 
-	unmountAll()
+	with phase("cli"):
+		DeployerCLI( net )
+	# Only the resources recorded in the journal are released, the other
+	# processes and the Open vSwitch of the host are left as they are
+	with phase("teardown"):
+		close_journal()
+		cleanup_journal(journal_path, config_workers)
+		root.cmd('start avahi-daemon') 
 
 def parse_cmd_line():
 	parser = argparse.ArgumentParser(description='Mininet Deployer')
 	parser.add_argument('--topology', dest='topoInfo', action='store', default='mesh:3', help='Topology Info topo:param, e.g., mesh:3 or file:topo.json')
+	parser.add_argument('--no-cache', dest='use_cache', action='store_false', help='Do not use the cached plans of the topology files')
+	parser.add_argument('--workers', dest='workers', action='store', type=int, default=1, help='Max number of nodes configured concurrently')
+	parser.add_argument('--flows-mode', dest='flows_mode', action='store', choices=FLOWS_MODES, default='add', help='Installation of the OSHI rules: add, replace or bundle (atomic, needs OpenFlow 1.4)')
+	parser.add_argument('--convergence-timeout', dest='convergence_timeout', action='store', type=int, default=120, help='Max seconds waited for the OSPF convergence before the CLI, 0 does not wait')
+	parser.add_argument('--profile', dest='profile', action='store', default=None, help='Write a json report with the time of the phases and of the commands')
+	parser.add_argument('--trace', dest='trace', action='store', default=None, help='Write a flame graph trace (collapsed stacks) of the commands')
+	parser.add_argument('--journal', dest='journal', action='store', default=JOURNAL_PATH, help='Journal of the resources of the deployment, released at the teardown')
+	parser.add_argument('--cleanup', dest='cleanup', action='store_true', help='Release the resources recorded in the journal of a crashed run and exit')
 	args = parser.parse_args()	
+	global use_cache
+	global config_workers
+	global flows_mode
+	global convergence_timeout
+	global profile_path
+	global trace_path
+	global journal_path
+	global cleanup_only
+	use_cache = args.use_cache
+	config_workers = max(1, args.workers)
+	flows_mode = args.flows_mode
+	convergence_timeout = max(0, args.convergence_timeout)
+	profile_path = args.profile
+	trace_path = args.trace
+	journal_path = args.journal
+	cleanup_only = args.cleanup
 	if len(sys.argv)==1:
     		parser.print_help()
     		sys.exit(1)
 	data = args.topoInfo.split(":")	
 	return (data[0], data[1])
 
+# The resources of a crashed run are released through its journal
+def cleanup_crashed_run():
+	if os.path.exists(journal_path):
+		print "*** Found The Journal Of A Previous Run"
+		cleanup_journal(journal_path, config_workers)
+
 def check_precond():
-	unmountAll()
+	cleanup_crashed_run()
 	if vll_path == "" or path_quagga_exec == "":
 		print "Error Set Environment Variable At The Beginning Of File"
 		sys.exit(-2)
 
 
-if __name__ == '__main__':
-	
+def main():
 	net = None
 	lg.setLogLevel('info')
 	(topo, param) = parse_cmd_line()
+	if profile_path != None or trace_path != None:
+		profiler = enable_profiling()
+	if cleanup_only:
+		cleanup_crashed_run()
+		return
 	check_precond()
-	if topo == 'file':
-		print "*** Create Topology From File:", param
-		net = buildTopoFromFile(param)
-	elif topo == 'mesh':
-		print "*** Create Built-in Topology mesh[%s]" % param
-		net = Mesh(int(param))
-	else:
-		print "*** Create Topology From Networkx:", topo, param
-		net = buildTopoFromNx(topo,param)
-	init_net(net)
+	open_journal(journal_path)
+	with phase("build"):
+		if topo == 'file':
+			print "*** Create Topology From File:", param
+			plan = buildTopoFromFile(param)
+		elif topo == 'mesh':
+			print "*** Create Built-in Topology mesh[%s]" % param
+			plan = Mesh(int(param))
+		else:
+			print "*** Create Topology From Networkx:", topo, param
+			plan = buildTopoFromNx(topo,param)
+	net = buildTopoFromPlan(plan)
+	init_net(net, plan)
+	if profile_path != None:
+		profiler.write_report(profile_path)
+	if trace_path != None:
+		profiler.write_trace(trace_path)
+
+if __name__ == '__main__':
+	main()
@@ -29,12 +29,71 @@
 from mininet.node import Host
 from mininet.log import debug, info
 from deployer_utils import MNRUNDIR, unmountAll
+from deployer_profiler import record_pipeline
 from mininet.util import errFail, quietRun, errRun
 from os.path import realpath
 
 
 import re
-
+import sys
+import time
+
+
+# DPID of the OSHI with the given loopback, it is also used by the plan compiler
+def loopbackDpid(loopback, extrainfo):
+    splitted_loopback = loopback.split('.')
+    hexloopback = '{:02X}{:02X}{:02X}{:02X}'.format(*map(int, splitted_loopback))
+    dpid = "%s%s" %(extrainfo, hexloopback)
+    if len(dpid)>16:
+        print "Unable To Derive DPID From Loopback and ExtraInfo";
+        sys.exit(-1)
+    return dpid
+
+# Max length of a pipelined command line, the shell of a node reads it from a
+# terminal and the lines of a terminal are limited to 4096 characters
+PIPELINE_MAX_LENGTH = 3500
+# In a pipelined command line every command is followed by a marker with its
+# index, exit code and end time (ns), STX <index>:<exit code>:<timestamp> ETX
+PIPELINE_MARKER = "printf '\\002%%d:%%d:%%s\\003' %d $? $(date +%%s%%N)"
+PIPELINE_MARKER_RE = re.compile( '\002([0-9]+):([0-9]+):([0-9]+)\003' )
+
+# Groups the commands in command lines of at most max_length characters, each
+# line runs its commands in order. A longer command would be truncated by the
+# terminal, the commands are split by the compiler (e.g. ovs_vsctl_lines)
+def pipelineLines( commands, max_length=PIPELINE_MAX_LENGTH ):
+    lines = []
+    parts = []
+    length = 0
+    for i in range( 0, len( commands ) ):
+        command = commands[ i ].strip()
+        # A background command cannot be followed by ";"
+        if command.endswith( '&' ):
+            part = "{ %s }; " % command + PIPELINE_MARKER % i
+        else:
+            part = "{ %s; }; " % command + PIPELINE_MARKER % i
+        if len( part ) > max_length:
+            print "Error Command Too Long For The Shell (%s Characters, Max %s) -" % ( len( part ), max_length ), command[ :80 ] + "..."
+            sys.exit(-2)
+        if len( parts ) > 0 and length + len( part ) + 2 > max_length:
+            lines.append( "; ".join( parts ) )
+            parts = []
+            length = 0
+        parts.append( part )
+        length = length + len( part ) + 2
+    if len( parts ) > 0:
+        lines.append( "; ".join( parts ) )
+    return lines
+
+# Splits the output of pipelined command lines, provides
+# index -> (output, exit code, end time in seconds)
+def pipelineResults( output ):
+    results = {}
+    start = 0
+    for marker in PIPELINE_MARKER_RE.finditer( output ):
+        results[ int( marker.group( 1 ) ) ] = ( output[ start:marker.start() ], int( marker.group( 2 ) ),
+            int( marker.group( 3 ) ) / 1e9 )
+        start = marker.end()
+    return results
 
 # This code has been taken from mininet's example bind.py, but we had to fix some stuff
 # because some thing don't work properly (for example xterm)
@@ -79,13 +138,24 @@ class OSHI( Host ):
         self.dpid = self.loopbackDpid(self.loopback, "00000000")
 
     def loopbackDpid(self, loopback, extrainfo):
-        splitted_loopback = loopback.split('.')
-        hexloopback = '{:02X}{:02X}{:02X}{:02X}'.format(*map(int, splitted_loopback))
-        dpid = "%s%s" %(extrainfo, hexloopback)
-        if len(dpid)>16:
-            print "Unable To Derive DPID From Loopback and ExtraInfo";
-            sys.exit(-1)
-        return dpid
+        return loopbackDpid(loopback, extrainfo)
+
+    def cmdPipeline( self, commands, max_length=PIPELINE_MAX_LENGTH ):
+        """Run the commands in order, pipelined: a batch of commands is
+           written to the shell at once and waits for a single prompt.
+           Returns the list of ( output, exit code ) of the commands,
+           the profiler gets the latency of each one from its marker"""
+        results = {}
+        for line in pipelineLines( commands, max_length ):
+            start = time.time()
+            lineResults = pipelineResults( self.cmd( line ) )
+            record_pipeline( self.name, [ ( commands[ i ], lineResults[ i ][ 2 ] ) for i in sorted( lineResults ) ],
+                start, time.time() )
+            results.update( lineResults )
+        if len( results ) != len( commands ):
+            print "Error Lost The Output Of %s Pipelined Commands On %s" % ( len( commands ) - len( results ), self.name )
+            sys.exit(-2)
+        return [ results[ i ][ :2 ] for i in range( 0, len( commands ) ) ]
 
     def defaultDpid( self ):
         "Derive dpid from switch name, s1 -> 1"
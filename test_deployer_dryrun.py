@@ -0,0 +1,135 @@
+#!/usr/bin/python
+
+##############################################################################################
+# Copyright (C) 2014 Pier Luigi Ventre - (Consortium GARR and University of Rome "Tor Vergata")
+# Copyright (C) 2014 Giuseppe Siracusano, Stefano Salsano - (CNIT and University of Rome "Tor Vergata")
+# www.garr.it - www.uniroma2.it/netgroup - www.cnit.it
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Tests Of The Deployer Dry Run.
+#
+# @author Pier Luigi Ventre <pl.ventre@gmail.com>
+# @author Giuseppe Siracusano <a_siracusano@tin.it>
+# @author Stefano Salsano <stefano.salsano@uniroma2.it>
+#
+#
+
+# The dry run is started as the user does (python -m unittest discover), it
+# needs the modules imported by mininet_deployer (networkx, numpy, matplotlib)
+
+import os
+import re
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+TMP_DIR = "/tmp"
+# A command of a pipelined command line (see OSHI.cmdPipeline)
+PIPELINED_COMMAND = re.compile(r"\{ (.*?);? \}; printf")
+
+def run_python(args, env):
+	process = subprocess.Popen([sys.executable] + args, cwd=REPO_DIR, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+	output = process.communicate()[0]
+	return (process.returncode, output)
+
+class DryRunTest(unittest.TestCase):
+
+	def setUp(self):
+		self.work_dir = tempfile.mkdtemp(prefix="dryrun_test")
+		self.env = dict(os.environ)
+		self.env['HOME'] = self.work_dir
+		self.env['PYTHONDONTWRITEBYTECODE'] = "1"
+		(code, output) = run_python(["-c", "import networkx, numpy, matplotlib"], self.env)
+		if code != 0:
+			shutil.rmtree(self.work_dir)
+			self.skipTest("the deployer dependencies are not installed")
+
+	def tearDown(self):
+		shutil.rmtree(self.work_dir, ignore_errors=True)
+
+	# Entries of TMP_DIR and of its dirs (one level), except the dir of the test
+	def snapshot(self):
+		entries = {}
+		for name in os.listdir(TMP_DIR):
+			path = os.path.join(TMP_DIR, name)
+			if path == self.work_dir:
+				continue
+			entries[name] = None
+			if os.path.isdir(path) and os.path.islink(path) == False:
+				try:
+					entries[name] = sorted(os.listdir(path))
+				except OSError:
+					pass
+		return entries
+
+	def test_tmp_untouched(self):
+		# A workdir of the topology (/tmp/osh1) with a file of someone else
+		node_dir = os.path.join(TMP_DIR, "osh1")
+		created = os.path.exists(node_dir) == False
+		if created:
+			os.mkdir(node_dir)
+			open(os.path.join(node_dir, "precious"), 'w').close()
+		try:
+			before = self.snapshot()
+			(code, output) = run_python(["deployer_dryrun.py", "--sandbox", os.path.join(self.work_dir, "sandbox"),
+				"--report", os.path.join(self.work_dir, "report.json"), "--topology", "file:topo_3_3_3.json", "--no-cache"], self.env)
+			self.assertEqual(code, 0, output)
+			self.assertEqual(before, self.snapshot())
+			# The workdirs of the nodes are created and removed in the sandbox
+			self.assertTrue(os.path.exists(os.path.join(self.work_dir, "sandbox", "tmp")))
+			self.assertEqual(os.listdir(os.path.join(self.work_dir, "sandbox", "tmp")), [])
+		finally:
+			if created:
+				shutil.rmtree(node_dir, ignore_errors=True)
+
+	# Commands run by the nodes after the first CLI command, name -> [command]
+	def redeploy_commands(self, path_record):
+		events = [json.loads(line) for line in open(path_record)]
+		cli = [i for (i, event) in enumerate(events) if event['kind'] == 'cli'][0]
+		commands = {}
+		for event in events[cli:]:
+			if event['kind'] == 'cmd':
+				commands.setdefault(event['node'], []).extend(PIPELINED_COMMAND.findall(event['detail']) or [event['detail']])
+		return commands
+
+	def test_redeploy_in_place(self):
+		# The topology without the link between two core OSHIs
+		topo = json.load(open(os.path.join(REPO_DIR, "topo", "topo_3_3_3.json")))
+		topo['edges'] = [edge for edge in topo['edges'] if edge[:2] != ["COSHI#01", "COSHI#03"]]
+		path_topo = os.path.join(self.work_dir, "topo.json")
+		json.dump(topo, open(path_topo, 'w'))
+		path_record = os.path.join(self.work_dir, "events.json")
+		(code, output) = run_python(["deployer_dryrun.py", "--record", path_record, "--report", os.path.join(self.work_dir, "report.json"),
+			"--topology", "file:topo_3_3_3.json", "--no-cache", "--cli", "redeploy file:" + os.path.relpath(path_topo, os.path.join(REPO_DIR, "topo"))], self.env)
+		self.assertEqual(code, 0, output)
+		self.assertIn("2 Nodes Changed In Place", output)
+		commands = self.redeploy_commands(path_record)
+		for (name, port) in (("osh1", 1), ("osh3", 0)):
+			# The daemons and the bridge keep running, only the port of the link goes
+			self.assertFalse(any("kill" in command or "del-br" in command or "zebra -f" in command for command in commands[name]), commands[name])
+			self.assertIn("ip link del vi%s.1" % port, commands[name])
+			self.assertTrue(any("del-port %s-eth%s" % (name, port) in command for command in commands[name]), commands[name])
+			self.assertIn("ovs-ofctl replace-flows br-%s /tmp/%s/ovs/flows.txt" % (name, name), commands[name])
+			vtysh = [command for command in commands[name] if command.startswith("vtysh")]
+			self.assertEqual(len(vtysh), 1)
+			self.assertIn("-c 'interface vi%s.1' -c 'no ip address" % port, vtysh[0])
+			self.assertIn("-c 'router ospf' -c 'no network 172.16.0.4/30 area 0.0.0.0'", vtysh[0])
+
+if __name__ == '__main__':
+	unittest.main()
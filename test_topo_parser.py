@@ -0,0 +1,103 @@
+#!/usr/bin/python
+
+##############################################################################################
+# Copyright (C) 2014 Pier Luigi Ventre - (Consortium GARR and University of Rome "Tor Vergata")
+# Copyright (C) 2014 Giuseppe Siracusano, Stefano Salsano - (CNIT and University of Rome "Tor Vergata")
+# www.garr.it - www.uniroma2.it/netgroup - www.cnit.it
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Tests Of The Topology Parser.
+#
+# @author Pier Luigi Ventre <pl.ventre@gmail.com>
+# @author Giuseppe Siracusano <a_siracusano@tin.it>
+# @author Stefano Salsano <stefano.salsano@uniroma2.it>
+#
+#
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from topo_parser import TopoParser
+
+# Size of the generated topology
+N_VERTICES = 10000
+KINDS = ['COSHI', 'AOSHI', 'L2SW', 'EUH']
+
+class TopoParserTest(unittest.TestCase):
+
+	def setUp(self):
+		self.topo_dir = tempfile.mkdtemp(prefix="topo_test")
+		self.path = TopoParser.path
+		TopoParser.path = self.topo_dir + "/"
+
+	def tearDown(self):
+		TopoParser.path = self.path
+		shutil.rmtree(self.topo_dir)
+
+	# Writes the topology in the test dir and provides its parser, the vertices
+	# are loaded and renamed (load_data)
+	def load(self, vertices, edges):
+		path_json = os.path.join(self.topo_dir, "topo.json")
+		json_file = open(path_json, 'w')
+		json.dump({'vertices':vertices, 'edges':[[lhs, rhs, {}] for (lhs, rhs) in edges]}, json_file)
+		json_file.close()
+		parser = TopoParser("topo.json")
+		parser.load_data()
+		return parser
+
+	def links(self, parser):
+		return [parser.model.link(link_id) for link_id in list(parser.pplinks) + list(parser.l2links)]
+
+	def test_10k_vertices(self):
+		vertices = ["%s#%s" % (KINDS[i % len(KINDS)], i + 1) for i in range(0, N_VERTICES)]
+		# A ring plus a chord for each vertex
+		edges = []
+		for i in range(0, N_VERTICES):
+			edges.append((vertices[i], vertices[(i + 1) % N_VERTICES]))
+			edges.append((vertices[i], vertices[(i * 7 + 3) % N_VERTICES]))
+		parser = self.load(vertices, edges)
+		names = parser.oshis + parser.aoshis + parser.l2sws + parser.euhs
+		self.assertEqual(len(names), N_VERTICES)
+		self.assertEqual(len(set(names)), N_VERTICES)
+		# The names of a kind follow the order of its vertices
+		rename = {}
+		for (kind, kind_names) in zip(KINDS, (parser.oshis, parser.aoshis, parser.l2sws, parser.euhs)):
+			rename.update(zip([vertex for vertex in vertices if vertex.startswith(kind + "#")], kind_names))
+		self.assertEqual(len(rename), N_VERTICES)
+		# Every endpoint is renamed to the name of its vertex
+		links = self.links(parser)
+		self.assertEqual(sorted(links), sorted([(rename[lhs], rename[rhs]) for (lhs, rhs) in edges]))
+		# A point to point subnet for each link without a L2 switch
+		parser.create_subnet()
+		self.assertEqual(len(parser.ppsubnets), len([edge for edge in edges if 'L2SW' not in edge[0] and 'L2SW' not in edge[1]]))
+
+	def test_exact_matching(self):
+		vertices = ["COSHI#1", "COSHI#10", "COSHI#2"]
+		parser = self.load(vertices, [("COSHI#1", "COSHI#2"), ("COSHI#10", "COSHI#2")])
+		self.assertEqual(parser.oshis, ["osh1", "osh2", "osh3"])
+		self.assertEqual(self.links(parser), [("osh1", "osh3"), ("osh2", "osh3")])
+
+	def test_unknown_vertex(self):
+		parser = self.load(["COSHI#1", "FOO#2"], [("COSHI#1", "FOO#2")])
+		self.assertEqual(parser.oshis, ["osh1"])
+		self.assertEqual(parser.aoshis + parser.l2sws + parser.euhs, [])
+		# The unknown vertex is not renamed
+		self.assertEqual(self.links(parser), [("osh1", "FOO#2")])
+
+if __name__ == '__main__':
+	unittest.main()
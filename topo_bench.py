@@ -0,0 +1,259 @@
+#!/usr/bin/python
+
+##############################################################################################
+# Copyright (C) 2014 Pier Luigi Ventre - (Consortium GARR and University of Rome "Tor Vergata")
+# Copyright (C) 2014 Giuseppe Siracusano, Stefano Salsano - (CNIT and University of Rome "Tor Vergata")
+# www.garr.it - www.uniroma2.it/netgroup - www.cnit.it
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Topology Parser Benchmark.
+#
+# @author Pier Luigi Ventre <pl.ventre@gmail.com>
+# @author Giuseppe Siracusano <a_siracusano@tin.it>
+# @author Stefano Salsano <stefano.salsano@uniroma2.it>
+#
+#
+
+# Generates synthetic topologies in the Dreamer json format and measures how
+# the TopoParser scales. Every measure runs in a fresh process, so the peak
+# memory of a run is not polluted by the previous ones. Usage:
+#
+#   ./topo_bench.py --sizes 10,1000,100000 --cores ring,mesh --output bench.json
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import resource
+import tempfile
+import subprocess
+
+from topo_parser import TopoParser
+
+CORES = ['mesh', 'ring', 'fat-tree']
+SIZES = [10, 100, 1000, 10000, 100000]
+# A full mesh has n*(n-1)/2 links, the core is limited to this number of OSHI
+MAX_MESH_CORE = 32
+# Max width of the spine layer of the fat-tree
+MAX_SPINES = 16
+
+# Generator of Dreamer topologies: a core of COSHI (mesh, ring or fat-tree)
+# and, for each access region, an AOSHI connected to the core with an access
+# tree of L2 switches (a chain of switches followed by a tree with fanout
+# branches for each level); every leaf switch serves euhs EUH
+class TopoGenerator:
+
+	def __init__(self, core='ring', chain=2, depth=1, fanout=2, euhs=2):
+		self.core = core
+		self.chain = chain
+		self.depth = depth
+		self.fanout = fanout
+		self.euhs = euhs
+		self.vertices = []
+		self.edges = []
+
+	def add_vertex(self, kind):
+		vertex = "%s#%s" % (kind, len(self.vertices) + 1)
+		self.vertices.append(vertex)
+		return vertex
+
+	def add_edge(self, lhs, rhs):
+		self.edges.append([lhs, rhs, {"labe_to_node1":"", "labe_to_node2":"", "edge_label":""}])
+
+	# Number of vertices of an access region
+	def region_size(self):
+		leaves = self.fanout ** self.depth
+		tree = 0
+		for level in range(0, self.depth + 1):
+			tree = tree + self.fanout ** level
+		return 1 + self.chain + (tree - 1) + leaves * self.euhs
+
+	def generate(self, size):
+		regions = max(2, size // (self.region_size() + 1))
+		if self.core == 'mesh':
+			cores = self.mesh(min(regions, MAX_MESH_CORE))
+		elif self.core == 'ring':
+			cores = self.ring(regions)
+		elif self.core == 'fat-tree':
+			cores = self.fat_tree(regions)
+		else:
+			print "Error Unknown Core Topology", self.core
+			sys.exit(-2)
+		for i in range(0, regions):
+			self.access_region(cores[i % len(cores)])
+		return {"vertices":self.vertices, "edges":self.edges}
+
+	def mesh(self, n):
+		cores = []
+		for i in range(0, n):
+			oshi = self.add_vertex("COSHI")
+			for rhs in cores:
+				self.add_edge(oshi, rhs)
+			cores.append(oshi)
+		return cores
+
+	def ring(self, n):
+		cores = []
+		for i in range(0, n):
+			oshi = self.add_vertex("COSHI")
+			if len(cores) > 0:
+				self.add_edge(oshi, cores[-1])
+			cores.append(oshi)
+		if n > 2:
+			self.add_edge(cores[-1], cores[0])
+		return cores
+
+	# Two levels fat-tree: the edge OSHI are connected to all the spine OSHI,
+	# the spine is sqrt(n) wide (at most MAX_SPINES); the access regions are
+	# attached to the edge layer
+	def fat_tree(self, n):
+		spines = []
+		for i in range(0, min(MAX_SPINES, max(1, int(n ** 0.5)))):
+			spines.append(self.add_vertex("COSHI"))
+		cores = []
+		for i in range(0, n):
+			oshi = self.add_vertex("COSHI")
+			for spine in spines:
+				self.add_edge(oshi, spine)
+			cores.append(oshi)
+		return cores
+
+	def access_region(self, oshi):
+		aoshi = self.add_vertex("AOSHI")
+		self.add_edge(aoshi, oshi)
+		last = aoshi
+		for i in range(0, self.chain):
+			sw = self.add_vertex("L2SW")
+			self.add_edge(sw, last)
+			last = sw
+		level = [last]
+		for d in range(0, self.depth):
+			next_level = []
+			for parent in level:
+				for i in range(0, self.fanout):
+					sw = self.add_vertex("L2SW")
+					self.add_edge(sw, parent)
+					next_level.append(sw)
+			level = next_level
+		for sw in level:
+			for i in range(0, self.euhs):
+				self.add_edge(self.add_vertex("EUH"), sw)
+
+# Parses the topology and measures the phases, it runs in the child process
+def run_case(path_json):
+	TopoParser.path = os.path.dirname(path_json) + "/"
+	parser = TopoParser(os.path.basename(path_json))
+	result = {}
+	start = time.time()
+	parser.load_data()
+	result['load_data_s'] = time.time() - start
+	start_subnet = time.time()
+	parser.create_subnet()
+	end = time.time()
+	result['create_subnet_s'] = end - start_subnet
+	result['parse_data_s'] = end - start
+	result['vertices'] = len(parser.model.names)
+	result['edges'] = len(parser.model.lhs)
+	result['ppsubnets'] = len(parser.ppsubnets)
+	result['l2subnets'] = len(parser.l2subnets)
+	links = 0
+	start = time.time()
+	for subnet in parser.ppsubnets + parser.l2subnets:
+		subnet.verbose = False
+		for link in subnet.getOrderedLinks():
+			links = links + 1
+	result['ordering_s'] = time.time() - start
+	result['ordered_links'] = links
+	# ru_maxrss is in KB on Linux
+	result['peak_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return result
+
+def run_child(path_json):
+	child = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--run', path_json], stdout=subprocess.PIPE)
+	(out, err) = child.communicate()
+	if child.returncode != 0:
+		print "Error Benchmark Run Failed For", path_json
+		sys.exit(-2)
+	# The parser can print warnings, the result is the last line
+	return json.loads(out.strip().split('\n')[-1])
+
+def benchmark(cores, sizes, repeat, generator_args):
+	results = []
+	tmpdir = tempfile.mkdtemp(prefix="topo_bench")
+	try:
+		for core in cores:
+			for size in sizes:
+				generator = TopoGenerator(core=core, **generator_args)
+				path_json = os.path.join(tmpdir, "%s_%s.json" % (core, size))
+				json_file = open(path_json, 'w')
+				json.dump(generator.generate(size), json_file)
+				json_file.close()
+				runs = [run_child(path_json) for i in range(0, repeat)]
+				# The best run for the times, the max for the memory
+				result = dict(runs[0])
+				for key in result:
+					if key.endswith('_s'):
+						result[key] = min([run[key] for run in runs])
+				result['peak_rss_kb'] = max([run['peak_rss_kb'] for run in runs])
+				result['core'] = core
+				result['size'] = size
+				result['file_bytes'] = os.path.getsize(path_json)
+				result['repeat'] = repeat
+				os.remove(path_json)
+				sys.stderr.write("*** %s %s: %s vertices, parse %.3fs, ordering %.3fs, peak %s KB\n" % (core, size,
+					result['vertices'], result['parse_data_s'], result['ordering_s'], result['peak_rss_kb']))
+				results.append(result)
+	finally:
+		shutil.rmtree(tmpdir, ignore_errors=True)
+	return results
+
+def parse_cmd_line():
+	parser = argparse.ArgumentParser(description='Topology Parser Benchmark')
+	parser.add_argument('--sizes', dest='sizes', action='store', default=','.join([str(size) for size in SIZES]), help='Comma separated number of vertices, e.g., 10,1000')
+	parser.add_argument('--cores', dest='cores', action='store', default=','.join(CORES), help='Comma separated core topologies: %s' % ', '.join(CORES))
+	parser.add_argument('--repeat', dest='repeat', action='store', type=int, default=1, help='Runs for each case')
+	parser.add_argument('--chain', dest='chain', action='store', type=int, default=2, help='L2 switches in the chain of each access region')
+	parser.add_argument('--depth', dest='depth', action='store', type=int, default=1, help='Levels of the L2 switch tree of each access region')
+	parser.add_argument('--fanout', dest='fanout', action='store', type=int, default=2, help='Fanout of the L2 switch tree')
+	parser.add_argument('--euhs', dest='euhs', action='store', type=int, default=2, help='EUH for each leaf L2 switch')
+	parser.add_argument('--output', dest='output', action='store', default=None, help='Output file (default stdout)')
+	parser.add_argument('--run', dest='run', action='store', default=None, help=argparse.SUPPRESS)
+	return parser.parse_args()
+
+if __name__ == '__main__':
+	args = parse_cmd_line()
+	if args.run != None:
+		print json.dumps(run_case(args.run))
+		sys.exit(0)
+	generator_args = {'chain':args.chain, 'depth':args.depth, 'fanout':args.fanout, 'euhs':args.euhs}
+	results = benchmark(args.cores.split(','), [int(size) for size in args.sizes.split(',')], args.repeat, generator_args)
+	report = {
+		'python':platform.python_version(),
+		'platform':platform.platform(),
+		'date':time.strftime("%Y-%m-%dT%H:%M:%S"),
+		'generator':generator_args,
+		'results':results
+	}
+	if args.output != None:
+		output = open(args.output, 'w')
+	else:
+		output = sys.stdout
+	json.dump(report, output, sort_keys=True, indent=2)
+	output.write('\n')
+	if args.output != None:
+		output.close()
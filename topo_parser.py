@@ -27,24 +27,31 @@
 #
 
 import os
-import json
 import sys
+from array import array
+from collections import deque
 from topo_parser_utils import Subnet
 from topo_parser_utils import TestbedSubnet
+from topo_parser_utils import TopoModel
+from topo_parser_utils import build_csr
+from topo_parser_utils import iter_json_arrays
 
 class TopoParser:
 	
 	path = "./topo/"
 	
-	# Init Function, load json_data from path_json
+	# Init Function, checks path_json; the json data is streamed
+	# from the file by parse_data and it is never fully loaded
 	def __init__(self, path_json, verbose=False):
 		self.verbose = verbose
 		self.oshis = []
 		self.aoshis = []
 		self.l2sws = []
 		self.euhs = []
-		self.pplinks = []
-		self.l2links = []
+		# Links are stored as ids of the model
+		self.model = TopoModel()
+		self.pplinks = array('l')
+		self.l2links = array('l')
 		self.ppsubnets = []
 		self.l2subnets = []
 		self.subnetclass = Subnet
@@ -54,114 +61,152 @@ class TopoParser:
 		if os.path.exists(path_json) == False:
 			print "Error Topo File Not Found"
 			sys.exit(-2)
-		json_file=open(path_json)
-		self.json_data = json.load(json_file)
-		json_file.close()
-		if self.verbose:
-			print "*** JSON Data Loaded:"
-			#print json.dumps(self.json_data, sort_keys=True, indent=4)
+		self.path_json = path_json
 
-	# Parse Function, first retrieves the vertices from json data,
-	# second retrieves the links from json data, finally create the
-	# subnets (PPsubnet, Core L2Subnet, Access L2Subnet)
+	# Parse Function, first retrieves the vertices and the links from json data,
+	# finally create the subnets (PPsubnet, Core L2Subnet, Access L2Subnet)
 	def parse_data(self):
-		self.load_vertex()
-		self.load_links()
+		self.load_data()
 		self.create_subnet()
 	
 	def getsubnets(self):
 		self.parse_data()
 		return (self.ppsubnets, self.l2subnets)
 
-	# Parses vertex from json_data, renames the node in 'vertices' and in 'edges', 
-	# and divides them in: oshi (Core Oshi), aoshi (Access Oshi), l2sws (Legacy L2 switch)
-	# and euhs (End User Host). 
-	# TODO Parse Nodes Properties
-	def load_vertex(self):
+	# Streams 'vertices' and 'edges' from the topology file: the vertices are renamed
+	# and classified as they arrive, the edges as soon as their endpoints are known
+	# (the edges found before the vertices are kept as pairs until the end of the file).
+	# Only the parsed model is kept in memory, the raw json data is discarded
+	def load_data(self):
 		if self.verbose:
-			print "*** Retrieve Vertex"
-		vertices = self.json_data['vertices']
-		edges = self.json_data['edges']
-		for vertex in vertices:
-			if 'COSH' in vertex:
-				data = vertex.split('#')
-				name = "osh" + str(len(self.oshis) + len(self.aoshis) + 1)
-				self.oshis.append(name) 
-			elif 'AOSH' in vertex:
-				data = vertex.split('#')
-				name = "aos" + str(len(self.oshis) + len(self.aoshis) + 1)
-				self.aoshis.append(name)
-			elif 'L2SW' in vertex:
-				data = vertex.split('#')
-				name = "sw" + str(len(self.l2sws) + 1)
-				self.l2sws.append(name)
-			elif 'EUH' in vertex:
-				data = vertex.split('#')
-				name = "euh" + str(len(self.euhs) + 1)
-				self.euhs.append(name)
-			for edge in edges:
-				i = 0
-				for side in edge:
-					if vertex in side:
-						edge[i] = name
-					i = i + 1
+			print "*** Retrieve Vertex And Links"
+		names = {}
+		pending = []
+		vertices_read = False
+		json_file = open(self.path_json)
+		for (key, item) in iter_json_arrays(json_file, ('vertices', 'edges')):
+			if key == 'vertices':
+				self.load_vertex(item, names)
+				vertices_read = True
+			elif vertices_read:
+				self.load_link(item, names)
+			else:
+				pending.append((item[0], item[1]))
+		json_file.close()
+		for edge in pending:
+			self.load_link(edge, names)
 		if self.verbose:		
 			print "*** OSHI:", self.oshis
 			print "*** AOSHI:", self.aoshis
 			print "*** L2SW:", self.l2sws
 			print "*** EUH:", self.euhs
+			print "*** L2links:", [self.model.link(link_id) for link_id in self.l2links]
+			print "*** PPlinks:", [self.model.link(link_id) for link_id in self.pplinks]
+
+	# Parses a vertex, renames it (the renaming map vertex id -> mininet name
+	# is stored in names) and puts it in: oshi (Core Oshi), aoshi (Access Oshi),
+	# l2sws (Legacy L2 switch) or euhs (End User Host).
+	# TODO Parse Nodes Properties
+	def load_vertex(self, vertex, names):
+		if 'COSH' in vertex:
+			name = "osh" + str(len(self.oshis) + len(self.aoshis) + 1)
+			self.oshis.append(name) 
+		elif 'AOSH' in vertex:
+			name = "aos" + str(len(self.oshis) + len(self.aoshis) + 1)
+			self.aoshis.append(name)
+		elif 'L2SW' in vertex:
+			name = "sw" + str(len(self.l2sws) + 1)
+			self.l2sws.append(name)
+		elif 'EUH' in vertex:
+			name = "euh" + str(len(self.euhs) + 1)
+			self.euhs.append(name)
+		else:
+			print "*** WARNING Unknown Vertex", vertex
+			return
+		self.model.add_node(name)
+		names[vertex] = name
 
-	# Parses link from json_data, then divides them in L2Links (Switched Links)
-	# and PPLinks (Point To Point Links)
+	# Parses a link, renames its endpoints using exact matching, then puts it
+	# in L2Links (Switched Links) or in PPLinks (Point To Point Links)
 	# TODO Parse Links Properties
-	def load_links(self):
-		if self.verbose:
-			print "*** Retrieve Links"
-		edges = self.json_data['edges']
-		for edge in edges:
-			if 'sw' in edge[0] or 'sw' in edge[1]:
-				self.l2links.append((edge[0], edge[1]))
-			else:
-				self.pplinks.append((edge[0], edge[1]))
-		if self.verbose:
-			print "*** L2links:", self.l2links
-			print "*** PPlinks:", self.pplinks
+	def load_link(self, edge, names):
+		lhs = names.get(edge[0], edge[0])
+		rhs = names.get(edge[1], edge[1])
+		link_id = self.model.add_link(lhs, rhs)
+		if 'sw' in lhs or 'sw' in rhs:
+			self.l2links.append(link_id)
+		else:
+			self.pplinks.append(link_id)
 	
 	# From the parsed Links, creates the associates Subnet, then divides them in
 	# L2subnet and PPsubnets
 	def create_subnet(self):
+		model = self.model
 		# Creates the ppsubnets
-		for pplink in self.pplinks:
-			s = self.subnetclass()
-			s.appendLink(pplink)
-			if 'euh' in pplink[0] or 'euh' in pplink[1]:
+		for link_id in self.pplinks:
+			s = self.subnetclass(model=model)
+			s.appendNodeId(model.lhs[link_id])
+			if model.rhs[link_id] != model.lhs[link_id]:
+				s.appendNodeId(model.rhs[link_id])
+			s.appendLinkId(link_id)
+			(lhs, rhs) = model.link(link_id)
+			if 'euh' in lhs or 'euh' in rhs:
 				s.type = "ACCESS"
 			self.ppsubnets.append(s)
 		# Eliminates all links
-		self.pplinks = []
+		self.pplinks = array('l')
 		if self.verbose:
 			i = 0
 			print "*** Subnets:"
 			for subnet in self.ppsubnets:
 				print "*** PP Subnet(%s) - Type %s: Nodes %s - Links %s" %(i + 1, subnet.type, subnet.nodes, subnet.links)
 				i = i + 1
-		# Creates the l2subnets
-		tmp = []
+		# Creates the l2subnets, exploring the switched links through the CSR
+		# adjacency; each link is visited once and each switch is expanded once,
+		# so the discovery is linear in the number of L2 links. The marks replace
+		# the membership tests on the nodes of the subnet under construction
+		(offsets, targets) = build_csr(model, self.l2links, len(model.names))
+		used = array('b', [0]) * len(self.l2links)
+		expanded = array('b', [0]) * len(model.names)
+		marks = array('l', [-1]) * len(model.names)
 		for sw in self.l2sws:
-			tmp.append(sw)
-			s = self.subnetclass()
+			start = model.ids[sw]
+			if expanded[start]:
+				continue
+			serial = len(self.l2subnets)
+			pairs = set()
+			tmp = deque([start])
+			s = self.subnetclass(model=model)
 			while len(tmp) > 0:
-				current = tmp[0]
-				if 'euh' in current:
+				current = tmp.popleft()
+				name = model.names[current]
+				if 'euh' in name:
 					s.type = "ACCESS"
-				tmp.pop(0)
-				(hops, links) = self.getNextHopAndLinks(current)
-				for hop in hops:
-					tmp.append(hop)
-				for link in links:
-					s.appendLink(link)
-			if len(s.links) > 0:
-				self.l2subnets.append(s)	
+				if 'euh' in name or 'aos' in name or 'osh' in name or expanded[current]:
+					continue
+				expanded[current] = 1
+				for index in targets[offsets[current]:offsets[current + 1]]:
+					if used[index]:
+						continue
+					used[index] = 1
+					link_id = self.l2links[index]
+					lhs = model.lhs[link_id]
+					rhs = model.rhs[link_id]
+					if lhs == current:
+						tmp.append(rhs)
+					else:
+						tmp.append(lhs)
+					for node_id in (lhs, rhs):
+						if marks[node_id] != serial:
+							marks[node_id] = serial
+							s.appendNodeId(node_id)
+					if (lhs, rhs) not in pairs:
+						pairs.add((lhs, rhs))
+						s.appendLinkId(link_id)
+			if len(s.link_ids) > 0:
+				self.l2subnets.append(s)
+		# Eliminates all links
+		self.l2links = array('l')
 		if self.verbose:
 			i = 0
 			print "*** Subnets:"
@@ -169,27 +214,6 @@ class TopoParser:
 				print "*** L2 Subnet(%s) - Type %s: Nodes %s - Links %s" %(i + 1, subnet.type, subnet.nodes, subnet.links)
 				i = i + 1
 
-	# Utility Function, provides node's next hop and links (to the nexthop)
-	# we use it to rebuild from scratch a l2subnets, XXX it deletes the l2links
-	# once we rebuild the subnet
-	def getNextHopAndLinks(self,node):
-		ret_links = []
-		ret_node = []
-		tmp = []
-		if 'euh' in node or 'aos' in node or 'osh' in node:
-			return ([],[])
-		for link in self.l2links:
-			if link[0] == node or link[1] == node:
-				ret_links.append(link)
-				if link[0] == node:
-					ret_node.append(link[1])
-				if link[1] == node:
-					ret_node.append(link[0])
-				tmp.append(link)
-		for link in tmp:
-			self.l2links.remove(link)
-		return (ret_node, ret_links)
-
 # Parser For Testbed Deployer
 class TestbedTopoParser(TopoParser):
 
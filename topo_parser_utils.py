@@ -26,28 +26,202 @@
 #
 #
 
-# Utility Class Store The Set Of Links and Nodes In a Subnet
-class Subnet: 
-	def __init__(self, Type=None):
-		self.nodes = []
-		self.links = []
+import json
+import re
+from array import array
+from collections import deque
+
+BLANKS = re.compile(r'[ \t\n\r]*')
+
+# Utility Class, incremental reader of a json file: it keeps in memory only
+# the part of the file that has not been decoded yet
+class JsonStream:
+	def __init__(self, json_file, chunk_size=65536):
+		self.json_file = json_file
+		self.chunk_size = chunk_size
+		self.decoder = json.JSONDecoder()
+		self.buf = ""
+		self.pos = 0
+		self.eof = False
+
+	# Reads at least size chars from the file, discarding the consumed ones
+	def read(self, size):
+		if self.eof:
+			return False
+		data = self.json_file.read(max(size, self.chunk_size))
+		if len(data) == 0:
+			self.eof = True
+			return False
+		self.buf = self.buf[self.pos:] + data
+		self.pos = 0
+		return True
+
+	# Provides the next non blank char, without consuming it
+	def peek(self):
+		while True:
+			self.pos = BLANKS.match(self.buf, self.pos).end()
+			if self.pos < len(self.buf):
+				return self.buf[self.pos]
+			if self.read(self.chunk_size) == False:
+				raise ValueError("Unexpected End Of JSON Data")
+
+	def expect(self, char):
+		if self.peek() != char:
+			raise ValueError("Expecting '%s' At Char %s Of JSON Buffer" % (char, self.pos))
+		self.pos = self.pos + 1
+
+	# Decodes the next json value, reading the file until it is complete
+	def decode(self):
+		self.peek()
+		while True:
+			try:
+				(value, end) = self.decoder.raw_decode(self.buf, self.pos)
+				# A number at the end of the buffer could be truncated
+				if end < len(self.buf) or self.read(self.chunk_size) == False:
+					self.pos = end
+					return value
+			except ValueError:
+				if self.read(len(self.buf)) == False:
+					raise
+
+# Utility Function, streams the items of the arrays stored in keys of the
+# top level json object, yields (key, item) in file order; the other values
+# are decoded and discarded
+def iter_json_arrays(json_file, keys):
+	stream = JsonStream(json_file)
+	stream.expect('{')
+	if stream.peek() == '}':
+		return
+	while True:
+		key = stream.decode()
+		stream.expect(':')
+		if key in keys:
+			stream.expect('[')
+			if stream.peek() == ']':
+				stream.pos = stream.pos + 1
+			else:
+				while True:
+					yield (key, stream.decode())
+					if stream.peek() == ']':
+						stream.pos = stream.pos + 1
+						break
+					stream.expect(',')
+		else:
+			stream.decode()
+		if stream.peek() == '}':
+			return
+		stream.expect(',')
+
+# Compact model of the parsed topology: the nodes are integer ids (the names
+# are stored once in the name table), the links are two arrays of node ids
+class TopoModel(object):
+	__slots__ = ('names', 'ids', 'lhs', 'rhs')
+
+	def __init__(self):
+		self.names = []
+		self.ids = {}
+		self.lhs = array('l')
+		self.rhs = array('l')
+
+	# Provides the id of the node, adding it to the name table if it is new
+	def add_node(self, name):
+		node_id = self.ids.get(name)
+		if node_id == None:
+			node_id = len(self.names)
+			self.ids[name] = node_id
+			self.names.append(name)
+		return node_id
+
+	# Stores the link between the two named nodes and provides its id
+	def add_link(self, lhs, rhs):
+		self.lhs.append(self.add_node(lhs))
+		self.rhs.append(self.add_node(rhs))
+		return len(self.lhs) - 1
+
+	# Provides the link as a pair of names
+	def link(self, link_id):
+		return (self.names[self.lhs[link_id]], self.names[self.rhs[link_id]])
+
+# Utility Function, provides the CSR adjacency (offsets, targets) of a list of link
+# ids: the links of the node in row r are targets[offsets[r]:offsets[r+1]], stored as
+# positions in link_ids (in the list order). rows maps the node ids to the rows,
+# if it is None the node id is the row
+def build_csr(model, link_ids, n_rows, rows=None):
+	offsets = array('l', [0]) * (n_rows + 1)
+	ends = array('l', [0]) * (2 * len(link_ids))
+	for index in range(0, len(link_ids)):
+		lhs = model.lhs[link_ids[index]]
+		rhs = model.rhs[link_ids[index]]
+		if rows != None:
+			lhs = rows[lhs]
+			rhs = rows[rhs]
+		ends[2 * index] = lhs
+		ends[2 * index + 1] = rhs
+		offsets[lhs + 1] = offsets[lhs + 1] + 1
+		if rhs != lhs:
+			offsets[rhs + 1] = offsets[rhs + 1] + 1
+	for row in range(0, n_rows):
+		offsets[row + 1] = offsets[row + 1] + offsets[row]
+	fill = array('l', offsets)
+	targets = array('l', [0]) * offsets[n_rows]
+	for index in range(0, len(link_ids)):
+		lhs = ends[2 * index]
+		rhs = ends[2 * index + 1]
+		targets[fill[lhs]] = index
+		fill[lhs] = fill[lhs] + 1
+		if rhs != lhs:
+			targets[fill[rhs]] = index
+			fill[rhs] = fill[rhs] + 1
+	return (offsets, targets)
+
+# Utility Class Store The Set Of Links and Nodes In a Subnet. Nodes and links are
+# stored as ids of the TopoModel, nodes and links provide them as names
+class Subnet(object):
+	__slots__ = ('model', 'node_ids', 'link_ids', 'type', 'verbose')
+
+	def __init__(self, Type=None, model=None):
+		if model == None:
+			model = TopoModel()
+		self.model = model
+		self.node_ids = array('l')
+		self.link_ids = array('l')
 		self.verbose = True
 		if Type == None:
 			self.type = "CORE"
 		else:
 			self.type = "ACCESS"
 
+	@property
+	def nodes(self):
+		names = self.model.names
+		return [names[node_id] for node_id in self.node_ids]
+
+	@property
+	def links(self):
+		return [self.model.link(link_id) for link_id in self.link_ids]
+
 	def appendLink(self, link):
-		if link[0] not in self.nodes:
-			self.nodes.append(link[0])
-		if link[1] not in self.nodes:
-			self.nodes.append(link[1])
-		if link not in self.links:
-			self.links.append(link)
+		lhs = self.model.add_node(link[0])
+		rhs = self.model.add_node(link[1])
+		if lhs not in self.node_ids:
+			self.node_ids.append(lhs)
+		if rhs not in self.node_ids:
+			self.node_ids.append(rhs)
+		for link_id in self.link_ids:
+			if self.model.lhs[link_id] == lhs and self.model.rhs[link_id] == rhs:
+				return
+		self.link_ids.append(self.model.add_link(link[0], link[1]))
+
+	# Low level append, the caller guarantees that node and link are new
+	def appendNodeId(self, node_id):
+		self.node_ids.append(node_id)
+
+	def appendLinkId(self, link_id):
+		self.link_ids.append(link_id)
 
 	# Provides the links in a proper order (if the network is "Access"; this order is very important for now in Mininet)
-	# the links are ordered, executing a deep-first search on L2Subnet, starting from the AOSHIS,
-	# XXX At the end of visit, the links are removed
+	# the links are ordered, executing a deep-first search on L2Subnet, starting from the AOSHIS.
+	# The subnet is not modified, so the order can be computed more than once
 	def getOrderedLinks(self):
 		if self.type == "ACCESS":
 			links = self.deep_first_search()
@@ -63,71 +237,55 @@ class Subnet:
 				ret_aos.append(node)
 		return ret_aos
 
-	# Executes a deep-first search on L2Subnet
+	# Executes a deep-first search on L2Subnet; every node is explored once and
+	# provides its links (not yet visited) in the same order of self.links
 	def deep_first_search(self):
 		if self.verbose:
 			print "*** Explore Subnet - Type %s: Nodes %s - Links %s" % (self.type, self.nodes, self.links)
-		nodes = self.getAOS()
+		model = self.model
+		rows = {}
+		for node_id in self.node_ids:
+			rows[node_id] = len(rows)
+		(offsets, targets) = build_csr(model, self.link_ids, len(rows), rows)
+		used = array('b', [0]) * len(self.link_ids)
+		seen = array('b', [0]) * len(rows)
+		nodes = deque()
+		for node_id in self.node_ids:
+			if 'aos' in model.names[node_id]:
+				seen[rows[node_id]] = 1
+				nodes.append(node_id)
 		ret_links = []
-		links = []
 		while len(nodes) > 0:
-			links_to_remove = []
-			node = nodes[0]
-			(tmpnodes, tmplinks) = self.getOrderedNextLinksAndNodes(node)
-			for tmpnode in tmpnodes:
-				if tmpnode not in nodes:
-					nodes.append(tmpnode)
-			for tmplink in tmplinks:
-				if tmplink not in links:
-					links.append(tmplink)
-			for link in links:
-				if node in link[0] or node in link[1]:
-					ret_links.append(link)
-					links_to_remove.append(link)
-			nodes.remove(node)
-			for toremove in links_to_remove:
-				links.remove(toremove)
+			node = nodes.popleft()
+			row = rows[node]
+			for index in targets[offsets[row]:offsets[row + 1]]:
+				if used[index]:
+					continue
+				used[index] = 1
+				link_id = self.link_ids[index]
+				if model.lhs[link_id] == node:
+					next_node = model.rhs[link_id]
+				else:
+					next_node = model.lhs[link_id]
+				if seen[rows[next_node]] == 0:
+					seen[rows[next_node]] = 1
+					nodes.append(next_node)
+				ret_links.append(model.link(link_id))
 		return ret_links
 
-	# get Next Hop and links towards the next hop, and pop the node and
-	# links from nodes and links before to return
-	def getOrderedNextLinksAndNodes(self, node):
-		ret_node = []
-		ret_link = []
-		for link in self.links:
-			if node in link[0]:
-				ret_node.append(link[1])
-				ret_link.append(link)
-			elif node in link[1]:
-				ret_node.append(link[0])
-				ret_link.append(link)
-		for link in ret_link:
-			self.links.remove(link)
-		self.nodes.remove(node)
-		return (ret_node, ret_link)
-
 class TestbedSubnet(Subnet):
+		__slots__ = ()
 
-		def __init__(self, Type=None):
-        		Subnet.__init__(self, Type)
+		def __init__(self, Type=None, model=None):
+        		Subnet.__init__(self, Type, model)
 
+		# Provides lazily the full-mesh of the subnet (sw excluded, no euh-euh links),
+		# the pairs are generated while the caller consumes them
 		def getOrderedLinks(self):
-			print self.nodes			
-			links = []
-			i = 0			
-			for i in range(0, len(self.nodes)):
-				for j in range(i+1,len(self.nodes)):
-					if 'sw' not in self.nodes[i] and 'sw' not in self.nodes[j]:
-						if 'euh' not in self.nodes[i] or 'euh' not in self.nodes[j]:
-							links.append((self.nodes[i], self.nodes[j]))
-					j = j + 1
-				i = i + 1
-			self.nodes = []
-			self.links = []
-			return links
-			
-
-
-
-
-
+			if self.verbose:
+				print "*** Full-Mesh Subnet - Type %s: %s Nodes" % (self.type, len(self.node_ids))
+			nodes = [node for node in self.nodes if 'sw' not in node]
+			for i in range(0, len(nodes)):
+				for j in range(i+1, len(nodes)):
+					if 'euh' not in nodes[i] or 'euh' not in nodes[j]:
+						yield (nodes[i], nodes[j])